@@ -0,0 +1,53 @@
+import threading
+import time
+
+# ---------- ACCOUNT STATUS CACHE ----------
+# login_required checks that the signed-in user is still active. Looking the
+# status up on every request would add a users query to every page, so each
+# worker keeps user_id -> status for a few seconds. The admin routes that
+# change a status invalidate the entry straight away; other workers pick the
+# change up when their entry expires.
+
+ACTIVE = "active"
+
+
+class AccountStatusCache:
+    def __init__(self, ttl=5.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id, load):
+        # load(user_id) -> status string, or None when the user no longer exists
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry and entry[1] > now:
+            return entry[0]
+        status = load(user_id)
+        status = status.lower() if status else None
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._evict(now)
+            self._entries[user_id] = (status, now + self.ttl)
+        return status
+
+    def is_active(self, user_id, load):
+        return self.get(user_id, load) == ACTIVE
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self, now):
+        expired = [key for key, (_, expires) in self._entries.items() if expires <= now]
+        for key in expired:
+            del self._entries[key]
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
@@ -0,0 +1,92 @@
+import threading
+from functools import wraps
+
+from flask import make_response
+
+# ---------- ADMISSION CONTROL ----------
+# Expensive endpoints (reports, PDF rendering) get a small number of
+# concurrent slots and a short wait queue. When both are full the request is
+# turned away at once with 503 + Retry-After, so the remaining worker threads
+# and DB connections stay free for bookings and tracking.
+#
+# A queued request still occupies a server thread, so on top of the
+# per-class limits every heavy request, running or queued, takes one unit of
+# a shared budget. The budget is sized from the worker's thread count minus a
+# reserve; when it is used up further heavy requests are rejected instead of
+# waiting.
+
+
+class Saturated(Exception):
+    pass
+
+
+class AdmissionClass:
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout, retry_after):
+        self.name = name
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self._waiting = 0
+
+    def acquire(self):
+        if self._slots.acquire(blocking=False):
+            return
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                raise Saturated(self.name)
+            self._waiting += 1
+        try:
+            if not self._slots.acquire(timeout=self.queue_timeout):
+                raise Saturated(self.name)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def release(self):
+        self._slots.release()
+
+
+class AdmissionController:
+    def __init__(self, budget=None):
+        # budget: most heavy requests (all classes, running + queued) per process
+        self.classes = {}
+        self.budget = budget
+        self._budget = threading.BoundedSemaphore(budget) if budget else None
+
+    def configure(self, name, max_concurrent, max_queue=4, queue_timeout=2.0, retry_after=10):
+        self.classes[name] = AdmissionClass(name, max_concurrent, max_queue, queue_timeout, retry_after)
+
+    def limit(self, name):
+        def decorator(f):
+            @wraps(f)
+            def wrapped(*args, **kwargs):
+                admission = self.classes[name]
+                try:
+                    self._acquire(admission)
+                except Saturated:
+                    resp = make_response("Server busy, please retry shortly.", 503)
+                    resp.headers["Retry-After"] = str(admission.retry_after)
+                    return resp
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    self._release(admission)
+            return wrapped
+        return decorator
+
+    def _acquire(self, admission):
+        if self._budget is not None and not self._budget.acquire(blocking=False):
+            raise Saturated(admission.name)
+        try:
+            admission.acquire()
+        except Saturated:
+            if self._budget is not None:
+                self._budget.release()
+            raise
+
+    def _release(self, admission):
+        admission.release()
+        if self._budget is not None:
+            self._budget.release()
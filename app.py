@@ -1,24 +1,54 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, g, jsonify
 import mysql.connector
 from mysql.connector import Error
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 import os
+import json
+import csv
+import io
+import itertools
 import uuid
 import random
 import string
 from datetime import datetime, timedelta
 import re
 from decimal import Decimal
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 from flask import make_response
 from io import BytesIO
+import time
+import click
+
+from archive import (archive_shipments, find_shipment, find_customer_shipments, find_customer_invoices,
+                     find_customer_invoice, find_booking_events, INVOICE_TABLES)
+from billing import run_billing, customer_statements, customer_statement
+from repository import Repository, StatementPool
+from admission import AdmissionController
+from tracking_feed import create_broker, event_stream, backlog_stream
+import rollups
+from onboarding import allocate_codes, onboard_employees, credentials_csv, resize_photo
+from labels import select_label_rows, check_label_count, build_labels_pdf, stream_file
+import migrate
+from sharding import (ShardRouter, load_shard_configs, init_shards, is_initialised, shard_statement,
+                      place_customer, move_customer)
+from account_status import AccountStatusCache, ACTIVE
+from compression import init_compression
+from tracking_filter import TrackingIdFilter
+from profiler import Profiler, collapsed_stacks, speedscope
 
 
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET", "cargo_secret_key")
+# Largest request body accepted (413 above it); the bulk onboarding photo ZIP
+# is the biggest upload
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_MB", 50)) * 1024 * 1024
+
+# gzip / zstd for HTML, CSV and JSON responses; PDFs and images are sent as-is
+init_compression(app,
+                 min_size=int(os.environ.get("COMPRESS_MIN_SIZE", 1024)),
+                 level=int(os.environ.get("COMPRESS_LEVEL", 6)),
+                 zstd_level=int(os.environ.get("COMPRESS_ZSTD_LEVEL", 3)))
 
 # ---------- DB CONFIG ----------
 DB_CONFIG = {
@@ -28,9 +58,187 @@ DB_CONFIG = {
     "database": "cargo_db"
 }
 
+# Most tracking ids accepted by one /customer/track/bulk call
+BULK_TRACKING_MAX_IDS = int(os.environ.get("BULK_TRACKING_MAX_IDS", 500))
+
+# Delivered / cancelled shipments older than this are moved to the archive tables
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 365))
+
+# Live tracking pub/sub; set TRACKING_BROKER_URL=redis://... when running
+# several worker processes (or the separate SSE server, gunicorn.sse.conf.py)
+# so events reach subscribers in every process. Recreated per worker.
+TRACKING_BROKER_URL = os.environ.get("TRACKING_BROKER_URL")
+tracking_broker = create_broker(TRACKING_BROKER_URL)
+
+# Each open feed holds a thread on the gthread server, so the feed is only
+# served where TRACKING_FEED=1: the gevent SSE server (sse_wsgi.py sets it)
+# or a dev server. Elsewhere /track/<id>/events answers 204, which stops the
+# browser's EventSource from reconnecting.
+TRACKING_FEED = os.environ.get("TRACKING_FEED") == "1"
+
+# Bloom filter of issued tracking ids; lookups for ids that were never issued
+# are answered without touching MySQL. Loaded by warm_up() from the snapshot.
+tracking_filter = TrackingIdFilter(
+    snapshot_path=os.environ.get("TRACKING_FILTER_SNAPSHOT",
+                                 os.path.join(os.path.dirname(os.path.abspath(__file__)), "tracking_filter.bin")),
+    capacity=int(os.environ.get("TRACKING_FILTER_CAPACITY", 1000000)),
+)
+
+# ---------- ADMISSION CONTROL ----------
+# Heavy endpoints, running or queued, never hold more than
+# WEB_THREADS - HEAVY_RESERVE_THREADS threads of a worker, so bookings and
+# tracking always have threads and DB connections left. The per-class limits
+# below divide that budget further.
+WEB_THREADS = int(os.environ.get("WEB_THREADS", 8))
+HEAVY_RESERVE_THREADS = int(os.environ.get("HEAVY_RESERVE_THREADS", 4))
+admission = AdmissionController(budget=max(WEB_THREADS - HEAVY_RESERVE_THREADS, 1))
+admission.configure("reports",
+                    max_concurrent=int(os.environ.get("REPORTS_CONCURRENCY", 2)),
+                    max_queue=int(os.environ.get("REPORTS_QUEUE", 2)),
+                    queue_timeout=float(os.environ.get("REPORTS_QUEUE_TIMEOUT", 5)),
+                    retry_after=30)
+admission.configure("pdf",
+                    max_concurrent=int(os.environ.get("PDF_CONCURRENCY", 4)),
+                    max_queue=int(os.environ.get("PDF_QUEUE", 8)),
+                    queue_timeout=float(os.environ.get("PDF_QUEUE_TIMEOUT", 2)),
+                    retry_after=5)
+
+# Suspended / deactivated users are signed out within this many seconds
+# in other worker processes (immediately in the one that made the change).
+account_status = AccountStatusCache(ttl=float(os.environ.get("ACCOUNT_STATUS_TTL", 5)))
+
+
+# On-demand stack sampling, switched on per endpoint from /admin/profiler.
+# Profiles and settings are kept in PROFILE_DIR so every worker shares them.
+profiler = Profiler(
+    os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")),
+    interval=float(os.environ.get("PROFILE_INTERVAL", 0.005)),
+)
+
+
+@app.before_request
+def start_profiling():
+    if profiler.should_profile(request.endpoint):
+        g.profile_sampler = profiler.start()
+
+
+@app.teardown_request
+def stop_profiling(exc):
+    # streamed bodies are produced after this point and are not sampled
+    sampler = g.pop("profile_sampler", None)
+    if sampler is not None:
+        profiler.finish(sampler, request.endpoint, request.full_path, "error" if exc else None)
+
+
+# Connections per process; 0 disables pooling (e.g. the dev server).
+# Keep it >= the number of threads per worker, the pool does not block.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 0))
+_db_pool = None
+
 
 def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+    global _db_pool
+    if DB_POOL_SIZE <= 0:
+        return mysql.connector.connect(**DB_CONFIG)
+    if _db_pool is None:
+        _db_pool = StatementPool(pool_name="cargo", pool_size=DB_POOL_SIZE, **DB_CONFIG)
+    # close() on a pooled connection hands it back to the pool
+    return _db_pool.get_connection()
+
+
+def reset_db_pool():
+    # connections must not be shared across fork(); each worker builds its own
+    global _db_pool, tracking_broker
+    _db_pool = None
+    shards.reset()
+    tracking_broker = create_broker(TRACKING_BROKER_URL)
+
+
+# ---------- SHARDING ----------
+# Bookings, tracking updates and invoices are placed by customer_id when
+# SHARDS is set (see sharding.py); otherwise everything is in DB_CONFIG.
+# Workers cache the customer -> shard directory for SHARD_DIRECTORY_TTL
+# seconds.
+SHARD_DIRECTORY_TTL = float(os.environ.get("SHARD_DIRECTORY_TTL", 30))
+shards = ShardRouter(
+    load_shard_configs(os.environ.get("SHARDS"), DB_CONFIG),
+    pool_size=DB_POOL_SIZE,
+    connect_single=get_db_connection,
+    primary_config=DB_CONFIG,
+    directory_ttl=SHARD_DIRECTORY_TTL,
+)
+
+
+def booking_connection(customer_id=None, booking_id=None, tracking_id=None):
+    # connection to the database that holds this customer's / booking's rows
+    if not shards.enabled:
+        return get_db_connection()
+    if customer_id is not None:
+        return shards.connect(shards.for_customer(customer_id))
+    if booking_id is not None:
+        return shards.connect(shards.for_booking_id(booking_id))
+    return shards.connect(shards.for_tracking_id(tracking_id))
+
+
+def customer_accounts(customer_ids):
+    # customer_id -> {username, fullname, email, user_id}, read from the primary database
+    customer_ids = sorted({cid for cid in customer_ids if cid is not None})
+    if not customer_ids:
+        return {}
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        placeholders = ",".join(["%s"] * len(customer_ids))
+        cursor.execute(f"""
+            SELECT c.id AS customer_id, c.user_id, u.username, u.fullname, u.email
+            FROM customers c JOIN users u ON c.user_id = u.id
+            WHERE c.id IN ({placeholders})
+        """, customer_ids)
+        return {row["customer_id"]: row for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def attach_customer(rows, *fields):
+    # adds the customer's account fields (default: username) to each row
+    accounts = customer_accounts(row["customer_id"] for row in rows)
+    for row in rows:
+        account = accounts.get(row["customer_id"], {})
+        for field in fields or ("username",):
+            row[field] = account.get(field)
+    return rows
+
+
+# ---------- WARM-UP ----------
+def warm_up(db=True):
+    started = time.perf_counter()
+
+    # compile every template once so the first request doesn't pay for it
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    # reportlab is imported lazily by the PDF routes; load it and the font here
+    from reportlab.pdfgen import canvas  # noqa: F401
+    from reportlab.pdfbase import pdfmetrics
+    pdfmetrics.getFont("Helvetica")
+
+    if db and DB_POOL_SIZE > 0:
+        get_db_connection().close()  # creating the pool opens all its connections
+
+    # already loaded when the master ran load_tracking_filter() before forking
+    if db and not tracking_filter.loaded:
+        tracking_filter.load(shards)
+
+    app.logger.info("Warm-up finished in %.0f ms", (time.perf_counter() - started) * 1000)
+
+
+def load_tracking_filter():
+    # Called once in the preloaded master (wsgi.py): the workers inherit the
+    # filter through fork instead of each scanning the bookings and writing
+    # the same snapshot. Uses its own unpooled connections, all closed again
+    # before the fork.
+    tracking_filter.load(ShardRouter(shards.configs))
 
 
 # ---------- AUTH DECORATORS ----------
@@ -44,14 +252,32 @@ def login_required(role=None):
             if role and session.get("role") != role:
                 flash("Access denied.", "danger")
                 return redirect(url_for("login"))
+            if not account_status.is_active(session["user_id"], load_user_status):
+                session.clear()
+                flash("Your account is not active. Please contact support.", "danger")
+                return redirect(url_for("login"))
             return f(*args, **kwargs)
         return wrapped
     return decorator
 
 
 # ---------- UTILITIES ----------
-def generate_tracking_id():
-    return str(uuid.uuid4()).split("-")[0].upper()
+def generate_tracking_id(customer_id=None):
+    tracking_id = str(uuid.uuid4()).split("-")[0].upper()
+    if customer_id is not None:
+        # sharded ids carry their shard so lookups can be routed directly
+        tracking_id = shards.encode_tracking_id(shards.for_customer(customer_id), tracking_id)
+    return tracking_id
+
+
+def publish_tracking_event(tracking_id, event_id, status, location, notes):
+    tracking_broker.publish(tracking_id, {
+        "id": event_id,
+        "status": status,
+        "location": location,
+        "notes": notes,
+        "updated_at": datetime.now().isoformat(sep=" ", timespec="seconds"),
+    })
 
 
 # ---------- ROUTES ----------
@@ -96,6 +322,8 @@ def signup():
 
             if role == "customer":
                 cursor.execute("INSERT INTO customers (user_id) VALUES (%s)", (user_id,))
+                if shards.enabled:
+                    place_customer(cursor, cursor.lastrowid, shards.count)
             elif role == "employee":
                 cursor.execute("INSERT INTO employees (user_id) VALUES (%s)", (user_id,))
 
@@ -130,6 +358,10 @@ def login():
             conn.close()
 
         if user and check_password_hash(user["password_hash"], password):
+            if (user["status"] or "").lower() != ACTIVE:
+                flash("Your account is not active. Please contact support.", "danger")
+                return render_template("login.html")
+            account_status.invalidate(user["id"])
             session["user_id"] = user["id"]
             session["username"] = user["username"]
             session["role"] = user["role"]
@@ -155,14 +387,16 @@ def logout():
 
 
 # --- helper function ---
+def load_user_status(user_id):
+    with Repository(get_db_connection()) as repo:
+        row = repo.fetch_one("user_status", (user_id,))
+    return row[0] if row else None
+
+
 def get_customer_id(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id FROM customers WHERE user_id=%s", (user_id,))
-    result = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    return result["id"] if result else None
+    with Repository(get_db_connection()) as repo:
+        result = repo.fetch_one("customer_id_for_user", (user_id,))
+    return result[0] if result else None
 
 
 # ---------- CUSTOMER ----------
@@ -176,15 +410,8 @@ def customer_dashboard():
         flash("Customer profile not found!", "danger")
         return redirect(url_for("customer_profile"))
 
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT * FROM cargo_bookings 
-        WHERE customer_id=%s ORDER BY booking_date DESC
-    """, (customer_id,))
-    shipments = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    with Repository(booking_connection(customer_id=customer_id)) as repo:
+        shipments = repo.fetch_all("customer_shipments", (customer_id,))
 
     return render_template("customer_dashboard.html", shipments=shipments)
 
@@ -204,20 +431,18 @@ def customer_book_cargo():
         weight = request.form.get("weight")
         package_value = request.form.get("cargo_value")   # renamed to match DB
 
-        conn = get_db_connection()
+        # 1. Get customer_id from logged in user
+        customer_id = get_customer_id(session.get("user_id"))
+        if not customer_id:
+            flash("Customer profile not found!", "danger")
+            return redirect(url_for("customer_dashboard"))
+
+        conn = booking_connection(customer_id=customer_id)
         cursor = conn.cursor()
 
         try:
-            # 1. Get customer_id from logged in user
-            cursor.execute("SELECT id FROM customers WHERE user_id=%s", (session.get("user_id"),))
-            result = cursor.fetchone()
-            if not result:
-                flash("Customer profile not found!", "danger")
-                return redirect(url_for("customer_dashboard"))
-            customer_id = result[0]
-
             # 2. Generate tracking ID
-            tracking_id = generate_tracking_id()
+            tracking_id = generate_tracking_id(customer_id)
 
             # 3. Insert cargo booking (fixed column names)
             cursor.execute("""
@@ -240,7 +465,10 @@ def customer_book_cargo():
                 VALUES (%s, %s, %s, %s)
             """, (booking_id, "pending", "Shipment Booked", "Shipment created by customer"))
 
+            rollups.record_new_booking(conn, booking_id)
+
             conn.commit()
+            tracking_filter.add(tracking_id)
             flash(f"Cargo booked successfully! Tracking ID: {tracking_id}", "success")
             return redirect(url_for("customer_dashboard"))
 
@@ -264,43 +492,82 @@ def customer_view_invoices():
         flash("Customer profile not found!", "danger")
         return redirect(url_for("customer_dashboard"))
 
-    conn = get_db_connection()
+    conn = booking_connection(customer_id=customer_id)
     cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT i.*, c.destination_city 
-        FROM invoices i 
-        JOIN cargo_bookings c ON i.booking_id=c.id 
-        WHERE c.customer_id=%s ORDER BY i.issued_at DESC
-    """, (customer_id,))
-    invoices = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    try:
+        # archived shipments keep their invoices, read from the archive tables
+        invoices = find_customer_invoices(cursor, customer_id)
+    finally:
+        cursor.close()
+        conn.close()
 
     return render_template("customer_view_invoices.html", invoices=invoices)        
 
 
+# --- Monthly consolidated invoices ---
+@app.route("/customer/statements")
+@login_required(role="customer")
+def customer_view_statements():
+    customer_id = get_customer_id(session.get("user_id"))
+    if not customer_id:
+        flash("Customer profile not found!", "danger")
+        return redirect(url_for("customer_dashboard"))
+
+    conn = booking_connection(customer_id=customer_id)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        statements = customer_statements(cursor, customer_id)
+    finally:
+        cursor.close()
+        conn.close()
+
+    return render_template("customer_view_statements.html", statements=statements, statement=None, items=[])
+
+
+@app.route("/customer/statements/<int:statement_id>")
+@login_required(role="customer")
+def customer_view_statement(statement_id):
+    customer_id = get_customer_id(session.get("user_id"))
+    statement, items = None, []
+    if customer_id:
+        conn = booking_connection(customer_id=customer_id)
+        cursor = conn.cursor(dictionary=True)
+        try:
+            statement, items = customer_statement(cursor, customer_id, statement_id)
+        finally:
+            cursor.close()
+            conn.close()
+
+    if not statement:
+        flash("Statement not found or unauthorized.", "danger")
+        return redirect(url_for("customer_view_statements"))
+
+    return render_template("customer_view_statements.html", statements=None, statement=statement, items=items)
+
+
 # --- Download Invoice as PDF ---
 @app.route("/customer/invoices/<int:invoice_id>/download")
 @login_required(role="customer")
+@admission.limit("pdf")
 def customer_download_invoice(invoice_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    cursor.execute("""
-        SELECT i.*, b.tracking_id, b.sender_name, b.recipient_name, u.fullname
-        FROM invoices i
-        JOIN cargo_bookings b ON i.booking_id=b.id
-        JOIN customers c ON b.customer_id=c.id
-        JOIN users u ON c.user_id=u.id
-        WHERE i.id=%s AND u.id=%s
-    """, (invoice_id, session.get("user_id")))
-    invoice = cursor.fetchone()
-    cursor.close()
-    conn.close()
+    customer_id = get_customer_id(session.get("user_id"))
+    invoice = None
+    if customer_id:
+        conn = booking_connection(customer_id=customer_id)
+        cursor = conn.cursor(dictionary=True)
+        try:
+            invoice = find_customer_invoice(cursor, customer_id, invoice_id)
+        finally:
+            cursor.close()
+            conn.close()
 
     if not invoice:
         flash("Invoice not found or unauthorized.", "danger")
         return redirect(url_for("customer_view_invoices"))
+    attach_customer([invoice], "fullname")
+
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
 
     # Generate PDF in memory
     response = make_response()
@@ -327,21 +594,30 @@ def customer_download_invoice(invoice_id):
 @app.route("/customer/invoices/<int:invoice_id>/pay")
 @login_required(role="customer")
 def customer_pay_invoice(invoice_id):
-    conn = get_db_connection()
+    customer_id = get_customer_id(session.get("user_id"))
+    if not customer_id:
+        flash("Customer profile not found!", "danger")
+        return redirect(url_for("customer_dashboard"))
+
+    conn = booking_connection(customer_id=customer_id)
     cursor = conn.cursor()
 
     try:
-        cursor.execute("""
-            UPDATE invoices i
-            JOIN cargo_bookings b ON i.booking_id=b.id
-            JOIN customers c ON b.customer_id=c.id
-            SET i.status='paid', i.paid_at=NOW()
-            WHERE i.id=%s AND c.user_id=%s
-        """, (invoice_id, session.get("user_id")))
+        # live invoice first, then one whose shipment has been archived
+        for invoices_table, bookings_table in INVOICE_TABLES:
+            cursor.execute(f"""
+                UPDATE {invoices_table} i
+                JOIN {bookings_table} b ON i.booking_id=b.id
+                SET i.status='paid', i.paid_at=NOW()
+                WHERE i.id=%s AND b.customer_id=%s AND i.status <> 'paid'
+            """, (invoice_id, customer_id))
+            if cursor.rowcount:
+                break
 
         if cursor.rowcount == 0:
             flash("Invoice not found or unauthorized.", "danger")
         else:
+            rollups.record_invoice_payment(conn, invoice_id, invoices_table, bookings_table)
             conn.commit()
             flash("Invoice paid successfully!", "success")
 
@@ -355,6 +631,135 @@ def customer_pay_invoice(invoice_id):
     return redirect(url_for("customer_view_invoices"))
 
 
+# Bulk tracking: JSON {"tracking_ids": [...]} or an uploaded CSV (first column)
+BULK_TRACKING_FIELDS = ["tracking_id", "found", "status", "latest_status", "latest_location",
+                        "latest_notes", "latest_update", "recipient_name", "recipient_address",
+                        "booking_date", "expected_delivery_date", "archived"]
+
+
+def read_bulk_tracking_ids():
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        raw = payload.get("tracking_ids") if isinstance(payload, dict) else payload
+        if not isinstance(raw, list):
+            raise ValueError('Send {"tracking_ids": [...]}')
+        raw = (str(tid) for tid in raw)
+    else:
+        upload = request.files.get("file")
+        if not upload or upload.filename.strip() == "":
+            raise ValueError("Upload a CSV file of tracking IDs")
+        # read row by row, so an oversized file is rejected without parsing all of it
+        text = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", errors="replace", newline="")
+        raw = (row[0] for row in csv.reader(text) if row)
+        first = next(raw, None)
+        if first is not None and first.strip().lower().replace(" ", "_") != "tracking_id":
+            raw = itertools.chain([first], raw)
+
+    tracking_ids = []
+    seen = set()
+    for tid in raw:
+        tid = tid.strip().upper()
+        if tid and tid not in seen:
+            if len(tracking_ids) == BULK_TRACKING_MAX_IDS:
+                raise ValueError(f"At most {BULK_TRACKING_MAX_IDS} tracking IDs per request")
+            seen.add(tid)
+            tracking_ids.append(tid)
+    if not tracking_ids:
+        raise ValueError("No tracking IDs given")
+    return tracking_ids
+
+
+def bulk_tracking_row(tracking_id, booking):
+    if booking is None:
+        return {"tracking_id": tracking_id, "found": False}
+    row = {field: booking.get(field) for field in BULK_TRACKING_FIELDS if field in booking}
+    row["tracking_id"] = booking["tracking_id"]
+    row["found"] = True
+    for field in ("latest_update", "booking_date", "expected_delivery_date"):
+        if row.get(field) is not None:
+            row[field] = row[field].isoformat()
+    return row
+
+
+@app.route("/customer/track/bulk", methods=["POST"])
+@login_required(role="customer")
+def customer_bulk_tracking():
+    try:
+        tracking_ids = read_bulk_tracking_ids()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    customer_id = get_customer_id(session.get("user_id"))
+    if not customer_id:
+        return jsonify({"error": "Customer profile not found"}), 404
+
+    # ids that were never issued can't be the customer's; skip them before the query
+    candidates = [tid for tid in tracking_ids if tracking_filter.might_exist(tid, shards)]
+    found = {}
+    if candidates:
+        conn = booking_connection(customer_id=customer_id)
+        cursor = conn.cursor(dictionary=True)
+        try:
+            found = find_customer_shipments(cursor, customer_id, candidates)
+        finally:
+            cursor.close()
+            conn.close()
+
+    # unknown ids and other customers' ids both come back as found=false
+    rows = [bulk_tracking_row(tid, found.get(tid)) for tid in tracking_ids]
+
+    fmt = request.args.get("format") or request.form.get("format")
+    if fmt != "csv" and not (fmt is None and request.accept_mimetypes.best == "text/csv"):
+        return jsonify({"count": len(rows), "found": len(found), "shipments": rows})
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=BULK_TRACKING_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            if buf.tell() >= 8192:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    resp = app.response_class(generate(), mimetype="text/csv")
+    resp.headers["Content-Disposition"] = "attachment; filename=bulk_tracking.csv"
+    return resp
+
+
+@app.route("/customer/track")
+@login_required(role="customer")
+def customer_track_shipment():
+    tracking_id = (request.args.get("tracking_id") or "").strip().lstrip("#")
+    tracking_info = None
+    tracking_updates = []
+
+    if tracking_id and tracking_filter.might_exist(tracking_id, shards):
+        customer_id = get_customer_id(session.get("user_id"))
+        conn = booking_connection(tracking_id=tracking_id)
+        cursor = conn.cursor(dictionary=True)
+        try:
+            tracking_info, tracking_updates = find_shipment(cursor, tracking_id)
+        finally:
+            cursor.close()
+            conn.close()
+        # other customers' shipments are reported like unknown ones
+        if tracking_info and tracking_info["customer_id"] != customer_id:
+            tracking_info, tracking_updates = None, []
+
+    if tracking_id and not tracking_info:
+        flash("No shipment found with that tracking ID.", "warning")
+
+    return render_template(
+        "customer_track_shipment.html",
+        tracking_id=tracking_id,
+        tracking_info=tracking_info,
+        tracking_updates=tracking_updates
+    )
+
+
 @app.route("/customer/support", methods=["GET", "POST"])
 @login_required(role="customer")
 def customer_support():
@@ -402,12 +807,15 @@ def customer_profile():
 @app.route("/employee/dashboard")
 @login_required(role="employee")
 def employee_dashboard():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM cargo_bookings ORDER BY booking_date DESC LIMIT 50")
-    bookings = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    def recent(conn):
+        with Repository(conn, owns_connection=False) as repo:
+            return repo.fetch_all("recent_bookings")
+
+    # latest 50 of each shard, merged newest first
+    bookings = sorted(
+        (b for shard_rows in shards.scatter(recent) for b in shard_rows),
+        key=lambda b: b.booking_date, reverse=True
+    )[:50]
     return render_template("employee_dashboard.html", bookings=bookings)
 
 # ---------- EMPLOYEE: Shipment History ----------
@@ -416,29 +824,23 @@ def employee_dashboard():
 def employee_shipment_history():
     employee_id = session.get("user_id")
 
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    try:
-        cursor.execute("""
-            SELECT b.id AS booking_id,
-                   b.sender_name,
-                   b.recipient_name,
-                   b.origin_city,
-                   b.destination_city,
-                   b.status,
-                   b.booking_date,
-                   t.location,
-                   t.status AS tracking_status,
-                   t.updated_at
-            FROM cargo_bookings b
-            LEFT JOIN tracking_updates t ON b.id = t.booking_id
-            WHERE b.assigned_employee_id = %s
-            ORDER BY b.booking_date DESC, t.updated_at DESC
-        """, (employee_id,))
-        history = cursor.fetchall()
-    finally:
-        cursor.close()
-        conn.close()
+    history = shards.gather_rows("""
+        SELECT b.id AS booking_id,
+               b.sender_name,
+               b.recipient_name,
+               b.origin_city,
+               b.destination_city,
+               b.status,
+               b.booking_date,
+               t.location,
+               t.status AS tracking_status,
+               t.updated_at
+        FROM cargo_bookings b
+        LEFT JOIN tracking_updates t ON b.id = t.booking_id
+        WHERE b.assigned_employee_id = %s
+        ORDER BY b.booking_date DESC, t.updated_at DESC
+    """, (employee_id,),
+        sort_key=lambda r: (r["booking_date"], r["updated_at"] or datetime.min), reverse=True)
 
     return render_template("employee_shipment_history.html", history=history)
 
@@ -448,50 +850,57 @@ def employee_shipment_history():
 @app.route("/employee/update_status/<int:booking_id>", methods=["GET", "POST"])
 @login_required(role="employee")
 def employee_update_status(booking_id):
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
     # --- Handle search by tracking_id ---
     tracking_id = request.args.get("tracking_id")
-    if booking_id is None and tracking_id:
-        cursor.execute("SELECT * FROM cargo_bookings WHERE tracking_id=%s", (tracking_id,))
-        booking = cursor.fetchone()
+    if booking_id is None and tracking_id and tracking_filter.might_exist(tracking_id, shards):
+        with Repository(booking_connection(tracking_id=tracking_id)) as repo:
+            booking = (repo.fetch_one("booking_id_by_tracking_id", (tracking_id,))
+                       or repo.fetch_one("archived_booking_id_by_tracking_id", (tracking_id,)))
         if booking:
-            booking_id = booking["id"]
+            booking_id = booking[0]
 
     if booking_id is None:
-        cursor.close()
-        conn.close()
         return render_template("employee_update_status.html", booking=None, updates=[])
 
-    if request.method == "POST":
-        status = request.form.get("status")
-        location = request.form.get("location")
-        notes = request.form.get("notes")
-
-        # Update booking
-        cursor.execute("UPDATE cargo_bookings SET status=%s WHERE id=%s", (status, booking_id))
-
-        # Insert tracking update
-        cursor.execute(
-            "INSERT INTO tracking_updates (booking_id, location, status, notes) VALUES (%s,%s,%s,%s)",
-            (booking_id, location, status, notes)
-        )
-        conn.commit()
-
-        flash("Status updated successfully", "success")
-        cursor.close()
-        conn.close()
-        return redirect(url_for("employee_update_status", booking_id=booking_id))
-
-    # Fetch booking + updates
-    cursor.execute("SELECT * FROM cargo_bookings WHERE id=%s", (booking_id,))
-    booking = cursor.fetchone()
-    cursor.execute("SELECT * FROM tracking_updates WHERE booking_id=%s ORDER BY updated_at DESC", (booking_id,))
-    updates = cursor.fetchall()
-
-    cursor.close()
-    conn.close()
+    with Repository(booking_connection(booking_id=booking_id)) as repo:
+        booking = repo.fetch_one("booking_summary", (booking_id,))
+        if booking is None:
+            # archived shipments are shown read-only
+            booking = repo.fetch_one("archived_booking_summary", (booking_id,))
+            if booking is None:
+                return render_template("employee_update_status.html", booking=None, updates=[])
+            if request.method == "POST":
+                flash("This shipment is archived and can no longer be updated.", "warning")
+                return redirect(url_for("employee_update_status", booking_id=booking_id))
+            updates = repo.fetch_all("archived_tracking_events", (booking_id,))
+            return render_template("employee_update_status.html", booking=booking, updates=updates, archived=True)
+
+        if request.method == "POST":
+            status = request.form.get("status")
+            location = request.form.get("location")
+            notes = request.form.get("notes")
+            try:
+                booking_status = rollups.booking_status_for(status)
+            except ValueError:
+                flash("Invalid status.", "danger")
+                return redirect(url_for("employee_update_status", booking_id=booking_id))
+
+            # Update booking; dispatched / arrived only appear in the tracking history
+            rollups.record_status_change(repo.conn, booking_id, booking_status)
+            repo.execute("update_booking_status", (booking_status, booking_id))
+
+            # Insert tracking update
+            event_id = repo.insert("insert_tracking_event", (booking_id, location, status, notes))
+            repo.commit()
+
+            booking = repo.fetch_one("tracking_id_by_booking_id", (booking_id,))
+            if booking:
+                publish_tracking_event(booking[0], event_id, status, location, notes)
+
+            flash("Status updated successfully", "success")
+            return redirect(url_for("employee_update_status", booking_id=booking_id))
+
+        updates = repo.fetch_all("tracking_events", (booking_id,))
 
     return render_template("employee_update_status.html", booking=booking, updates=updates)
 
@@ -513,23 +922,21 @@ def admin_dashboard():
         cursor.execute("SELECT COUNT(*) AS total FROM users WHERE role='employee'")
         employees = cursor.fetchone()["total"]
 
-        cursor.execute("SELECT COUNT(*) AS total FROM cargo_bookings")
-        bookings = cursor.fetchone()["total"]
-
-        # Recent bookings (read-only, no actions)
-        cursor.execute("""
-            SELECT cb.id, cb.destination_city, cb.status, u.username
-            FROM cargo_bookings cb
-            JOIN customers c ON cb.customer_id = c.id
-            JOIN users u ON c.user_id = u.id
-            ORDER BY cb.created_at DESC
-            LIMIT 10
-        """)
-        bookings_list = cursor.fetchall()
     finally:
         cursor.close()
         conn.close()
 
+    # Booking stats are gathered from every shard in parallel
+    bookings = shards.gather_count("SELECT COUNT(*) AS total FROM cargo_bookings")
+
+    # Recent bookings (read-only, no actions)
+    bookings_list = attach_customer(shards.gather_rows("""
+        SELECT cb.id, cb.destination_city, cb.status, cb.customer_id, cb.created_at
+        FROM cargo_bookings cb
+        ORDER BY cb.created_at DESC
+        LIMIT 10
+    """, sort_key=lambda r: r["created_at"], reverse=True, limit=10))
+
     return render_template(
         "admin_dashboard.html",
         customers=customers,
@@ -571,6 +978,7 @@ def edit_customer(id):
             (fullname, email, status, id)
         )
         conn.commit()
+        account_status.invalidate(id)
         flash("Customer updated successfully!", "success")
         return redirect(url_for("admin_manage_customers"))
     cursor.execute("SELECT * FROM users WHERE id=%s", (id,))
@@ -604,6 +1012,7 @@ def activate_customer(id):
     conn.commit()
     cursor.close()
     conn.close()
+    account_status.invalidate(id)
 
     flash("Customer activated", "success")
     return redirect(url_for("admin_manage_customers"))
@@ -618,6 +1027,7 @@ def suspend_customer(id):
     conn.commit()
     cursor.close()
     conn.close()
+    account_status.invalidate(id)
 
     flash("Customer suspended", "info")
     return redirect(url_for("admin_manage_customers"))
@@ -678,9 +1088,7 @@ def admin_employee_registration():
             user_id = cursor.lastrowid
 
             # ---------- Generate unique employee code ----------
-            cursor.execute("SELECT COUNT(*) FROM employees")
-            count = cursor.fetchone()[0] + 1
-            employee_code = f"EMP{count:03d}"
+            employee_code = allocate_codes(cursor, 1)[0]
 
             # ---------- Insert into employees ----------
             cursor.execute(
@@ -706,12 +1114,14 @@ def admin_employee_registration():
 
             # ---------- Handle photo upload ----------
             if photo and photo.filename.strip() != "":
-                ext = os.path.splitext(photo.filename)[1]  # keep extension
-                filename = f"{employee_code}{ext}"
+                # same size/format as bulk onboarding, not the raw upload
+                resized = resize_photo(photo.read())
+                filename = f"{employee_code}.jpg"
                 upload_folder = os.path.join("static", "uploads", "employees")
                 os.makedirs(upload_folder, exist_ok=True)
                 filepath = os.path.join(upload_folder, filename)
-                photo.save(filepath)
+                with open(filepath, "wb") as fh:
+                    fh.write(resized)
 
                 # update employee photo field
                 cursor.execute(
@@ -738,10 +1148,45 @@ def admin_employee_registration():
     return render_template("admin_employee_registration.html")
 
 
+# ---------- ADMIN: Bulk Employee Onboarding ----------
+@app.route("/admin/employee/bulk_register", methods=["GET", "POST"])
+@login_required(role="admin")
+def admin_bulk_onboarding():
+    if request.method == "POST":
+        employees_csv = request.files.get("employees_csv")
+        photos_zip = request.files.get("photos_zip")
+        if not employees_csv or employees_csv.filename.strip() == "":
+            flash("Please upload the employees CSV", "warning")
+            return redirect(url_for("admin_bulk_onboarding"))
+
+        conn = get_db_connection()
+        try:
+            created = onboard_employees(
+                conn,
+                employees_csv.read(),
+                photos_zip.read() if photos_zip and photos_zip.filename.strip() != "" else None,
+                upload_folder=os.path.join("static", "uploads", "employees"),
+                workers=int(os.environ.get("ONBOARDING_WORKERS", os.cpu_count() or 1)),
+            )
+        except (Error, ValueError, RuntimeError) as e:
+            flash(f"Error onboarding employees: {e}", "danger")
+            return redirect(url_for("admin_bulk_onboarding"))
+        finally:
+            conn.close()
+
+        # temporary passwords are only shown once, as a CSV download
+        return (credentials_csv(created), 200, {
+            "Content-Type": "text/csv",
+            "Content-Disposition": "attachment; filename=onboarded_employees.csv"
+        })
+
+    return render_template("admin_bulk_onboarding.html")
+
+
 @app.route("/admin/assign_employee/<int:booking_id>", methods=["GET", "POST"])
 @login_required(role="admin")
 def admin_assign_employee(booking_id):
-    conn = get_db_connection()
+    conn = booking_connection(booking_id=booking_id)
     cursor = conn.cursor(dictionary=True)
 
     if request.method == "POST":
@@ -756,18 +1201,22 @@ def admin_assign_employee(booking_id):
         flash("Employee assigned successfully!", "success")
         return redirect(url_for("admin_dashboard"))
 
+    # Get booking details
+    cursor.execute("SELECT id, assigned_employee_id FROM cargo_bookings WHERE id=%s", (booking_id,))
+    booking = cursor.fetchone()
+
+    cursor.close()
+    conn.close()
+
     # ✅ Get employees with names from `users`
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
     cursor.execute("""
         SELECT e.employee_id, u.fullname AS full_name, e.employee_code
         FROM employees e
         JOIN users u ON e.user_id = u.id
     """)
     employees = cursor.fetchall()
-
-    # Get booking details
-    cursor.execute("SELECT id, assigned_employee_id FROM cargo_bookings WHERE id=%s", (booking_id,))
-    booking = cursor.fetchone()
-
     cursor.close()
     conn.close()
 
@@ -778,22 +1227,43 @@ def admin_assign_employee(booking_id):
 @app.route("/admin/update_status/<int:booking_id>", methods=["GET", "POST"])
 @login_required(role="admin")
 def admin_update_status(booking_id):   
-    conn = get_db_connection()
+    conn = booking_connection(booking_id=booking_id)
     cursor = conn.cursor(dictionary=True)
-
-    if request.method == "POST":
-        new_status = request.form.get("status")
-        cursor.execute("UPDATE cargo_bookings SET status=%s WHERE id=%s", (new_status, booking_id))
-        conn.commit()
+    try:
+        cursor.execute("SELECT id, tracking_id, status FROM cargo_bookings WHERE id=%s", (booking_id,))
+        booking = cursor.fetchone()
+        if booking is None:
+            # archived shipments are shown read-only
+            cursor.execute("SELECT id, tracking_id, status FROM cargo_bookings_archive WHERE id=%s", (booking_id,))
+            booking = cursor.fetchone()
+            if booking is None:
+                flash("Booking not found.", "warning")
+                return redirect(url_for("admin_dashboard"))
+            if request.method == "POST":
+                flash("This shipment is archived and can no longer be updated.", "warning")
+                return redirect(url_for("admin_update_status", booking_id=booking_id))
+            return render_template("admin_update_status.html", booking=booking, archived=True)
+
+        if request.method == "POST":
+            new_status = request.form.get("status")
+            notes = "Status updated by admin"
+            if new_status not in rollups.BOOKING_STATUSES:
+                flash("Invalid status.", "danger")
+                return redirect(url_for("admin_update_status", booking_id=booking_id))
+            rollups.record_status_change(conn, booking_id, new_status)
+            cursor.execute("UPDATE cargo_bookings SET status=%s WHERE id=%s", (new_status, booking_id))
+            cursor.execute(
+                "INSERT INTO tracking_updates (booking_id, status, notes) VALUES (%s,%s,%s)",
+                (booking_id, new_status, notes)
+            )
+            event_id = cursor.lastrowid
+            conn.commit()
+            publish_tracking_event(booking["tracking_id"], event_id, new_status, None, notes)
+            flash("Booking status updated successfully!", "success")
+            return redirect(url_for("admin_dashboard"))
+    finally:
         cursor.close()
         conn.close()
-        flash("Booking status updated successfully!", "success")
-        return redirect(url_for("admin_dashboard"))
-
-    cursor.execute("SELECT id, status FROM cargo_bookings WHERE id=%s", (booking_id,))
-    booking = cursor.fetchone()
-    cursor.close()
-    conn.close()
 
     return render_template("admin_update_status.html", booking=booking)
 
@@ -804,16 +1274,11 @@ def admin_update_status(booking_id):
 # --------------------------
 @app.route("/admin/download_invoice/<int:booking_id>")
 @login_required(role="admin")
+@admission.limit("pdf")
 def admin_download_invoice(booking_id):
-    conn = get_db_connection()
+    conn = booking_connection(booking_id=booking_id)
     cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT cb.*, u.username, u.email
-        FROM cargo_bookings cb
-        JOIN customers c ON cb.customer_id = c.id
-        JOIN users u ON c.user_id = u.id
-        WHERE cb.id=%s
-    """, (booking_id,))
+    cursor.execute("SELECT cb.* FROM cargo_bookings cb WHERE cb.id=%s", (booking_id,))
     booking = cursor.fetchone()
     cursor.close()
     conn.close()
@@ -821,6 +1286,10 @@ def admin_download_invoice(booking_id):
     if not booking:
         flash("Booking not found", "danger")
         return redirect(url_for("admin_dashboard"))
+    attach_customer([booking], "username", "email")
+
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
 
     buffer = BytesIO()
     pdf = canvas.Canvas(buffer, pagesize=letter)
@@ -853,16 +1322,23 @@ def activate_employee(employee_code):
     cursor = conn.cursor()
     cursor.execute("""
         UPDATE users u 
-        JOIN employees e ON u.user_id = e.user_id 
+        JOIN employees e ON u.id = e.user_id 
         SET u.status='active' 
         WHERE e.employee_code=%s
     """, (employee_code,))
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_employee_status(employee_code)
     flash("Employee activated successfully", "success")
     return redirect(url_for("admin_manage_employees"))
 
+def invalidate_employee_status(employee_code):
+    with Repository(get_db_connection()) as repo:
+        row = repo.fetch_one("user_id_for_employee_code", (employee_code,))
+    if row:
+        account_status.invalidate(row[0])
+
 @app.route("/admin/employee/<employee_code>/deactivate")
 @login_required(role="admin")
 def deactivate_employee(employee_code):
@@ -870,13 +1346,14 @@ def deactivate_employee(employee_code):
     cursor = conn.cursor()
     cursor.execute("""
         UPDATE users u 
-        JOIN employees e ON u.user_id = e.user_id 
+        JOIN employees e ON u.id = e.user_id 
         SET u.status='inactive' 
         WHERE e.employee_code=%s
     """, (employee_code,))
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_employee_status(employee_code)
     flash("Employee deactivated successfully", "info")
     return redirect(url_for("admin_manage_employees"))
 
@@ -886,18 +1363,12 @@ def deactivate_employee(employee_code):
 @app.route("/admin/manage_cargo")
 @login_required(role="admin")
 def admin_manage_cargo():
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT b.*, u.username 
+    # every shard sorted by booking_date, merged newest first
+    bookings = attach_customer(shards.gather_rows("""
+        SELECT b.*
         FROM cargo_bookings b
-        JOIN customers c ON b.customer_id = c.id
-        JOIN users u ON c.user_id = u.id
         ORDER BY b.booking_date DESC
-    """)
-    bookings = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    """, sort_key=lambda r: r["booking_date"], reverse=True))
     return render_template("admin_manage_cargo.html", bookings=bookings)
 
 
@@ -906,7 +1377,7 @@ def admin_manage_cargo():
 @login_required(role="admin")
 def admin_create_invoice(booking_id):
     amount = request.form.get("amount")
-    conn = get_db_connection()
+    conn = booking_connection(booking_id=booking_id)
     cursor = conn.cursor()
     try:
         cursor.execute(
@@ -923,6 +1394,58 @@ def admin_create_invoice(booking_id):
         conn.close()
     return redirect(url_for("admin_manage_cargo"))
 
+
+# Shipping labels for a selection of bookings
+@app.route("/admin/labels", methods=["GET", "POST"])
+@login_required(role="admin")
+@admission.limit("pdf")
+def admin_print_labels():
+    if request.method == "POST":
+        status = request.form.get("status") or None
+        origin_city = request.form.get("origin_city") or None
+        booking_ids = [int(x) for x in re.findall(r"\d+", request.form.get("booking_ids", ""))]
+
+        try:
+            rows = [row for shard_rows in shards.scatter(
+                lambda conn: select_label_rows(conn, status=status, origin_city=origin_city, booking_ids=booking_ids)
+            ) for row in shard_rows]
+            check_label_count(len(rows))
+        except ValueError as e:
+            flash(str(e), "warning")
+            return redirect(url_for("admin_print_labels"))
+
+        if not rows:
+            flash("No bookings match that selection.", "warning")
+            return redirect(url_for("admin_print_labels"))
+
+        path, workdir = build_labels_pdf(rows, workers=int(os.environ.get("LABEL_WORKERS", os.cpu_count() or 1)))
+        resp = app.response_class(stream_file(path, workdir), mimetype="application/pdf")
+        resp.headers["Content-Length"] = str(os.path.getsize(path))
+        resp.headers["Content-Disposition"] = f"attachment; filename=labels_{len(rows)}.pdf"
+        return resp
+
+    return render_template("admin_print_labels.html")
+
+
+# Billing run: invoice every delivered booking that has no invoice yet
+@app.route("/admin/billing_run", methods=["POST"])
+@login_required(role="admin")
+def admin_billing_run():
+    month = request.form.get("month") or None
+    consolidate = request.form.get("consolidate") == "on"
+    try:
+        # a customer's bookings and invoices share a shard, so each shard bills independently
+        results = shards.scatter(lambda conn: run_billing(conn, month=month, consolidate=consolidate))
+        created = sum(r[0] for r in results)
+        consolidated = sum(r[1] for r in results)
+        msg = f"Billing run created {created} invoices"
+        if consolidate:
+            msg += f", {consolidated} added to monthly customer invoices"
+        flash(msg, "success")
+    except (Error, ValueError, RuntimeError) as e:
+        flash(f"Error running billing: {e}", "danger")
+    return redirect(url_for("admin_manage_cargo"))
+
 # Track Shipments
 @app.route("/admin/track_shipments", methods=["GET", "POST"])
 @login_required(role="admin")
@@ -933,35 +1456,19 @@ def admin_track_shipments():
     if request.method == "POST":
         tracking_id = request.form.get("tracking_id")
 
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        if tracking_filter.might_exist(tracking_id, shards):
+            conn = booking_connection(tracking_id=tracking_id)
+            cursor = conn.cursor(dictionary=True)
 
-        try:
-            # 1. Get booking info by tracking_id
-            cursor.execute("""
-                SELECT b.id AS booking_id, b.tracking_id, b.sender_name, b.sender_address,
-                       b.recipient_name, b.recipient_address, b.status,
-                       u.fullname AS customer
-                FROM cargo_bookings b
-                JOIN customers c ON b.customer_id = c.id
-                JOIN users u ON c.user_id = u.id
-                WHERE b.tracking_id = %s
-            """, (tracking_id,))
-            tracking_info = cursor.fetchone()
-
-            if tracking_info:
-                # 2. Get tracking updates for that booking
-                cursor.execute("""
-                    SELECT status, location, notes, updated_at
-                    FROM tracking_updates
-                    WHERE booking_id = %s
-                    ORDER BY updated_at DESC
-                """, (tracking_info["booking_id"],))
-                tracking_updates = cursor.fetchall()
+            try:
+                # Falls back to the archive tables for old delivered shipments
+                tracking_info, tracking_updates = find_shipment(cursor, tracking_id)
+            finally:
+                cursor.close()
+                conn.close()
 
-        finally:
-            cursor.close()
-            conn.close()
+        if tracking_info:
+            tracking_info["customer"] = attach_customer([tracking_info], "fullname")[0]["fullname"]
 
     return render_template(
         "admin_track_shipments.html",
@@ -971,17 +1478,130 @@ def admin_track_shipments():
 
 
 
+# Analytics (reads only the daily rollup tables)
+@app.route("/admin/analytics")
+@login_required(role="admin")
+def admin_analytics():
+    date_to = request.args.get("dateTo") or datetime.now().date().isoformat()
+    date_from = request.args.get("dateFrom") or (datetime.now().date() - timedelta(days=30)).isoformat()
+
+    bookings_by_status, revenue, on_time = rollups.merge_dashboards(
+        shards.scatter(lambda conn: rollups.load_dashboard(conn, date_from, date_to))
+    )
+
+    return render_template(
+        "admin_analytics.html",
+        date_from=date_from,
+        date_to=date_to,
+        bookings_by_status=bookings_by_status,
+        revenue=revenue,
+        on_time=on_time
+    )
+
+
+# Profiler (sampled stacks for chosen endpoints)
+@app.route("/admin/profiler", methods=["GET", "POST"])
+@login_required(role="admin")
+def admin_profiler():
+    if request.method == "POST":
+        endpoints = [e for e in request.form.getlist("endpoints") if e in app.view_functions]
+        try:
+            sample_rate = float(request.form.get("sample_percent") or 0) / 100
+        except ValueError:
+            flash("Sample percentage must be a number", "danger")
+            return redirect(url_for("admin_profiler"))
+        if request.form.get("action") == "stop":
+            endpoints, sample_rate = [], 0
+        profiler.configure(endpoints, sample_rate)
+        flash("Profiling stopped" if not endpoints and not sample_rate else "Profiling settings saved", "success")
+        return redirect(url_for("admin_profiler"))
+
+    profiler.refresh()
+    return render_template(
+        "admin_profiler.html",
+        endpoints=sorted(e for e in app.view_functions if e != "static"),
+        selected=profiler.endpoints,
+        sample_percent=round(profiler.sample_rate * 100, 2),
+        profiles=profiler.list_profiles()
+    )
+
+
+@app.route("/admin/profiler/<name>/download")
+@login_required(role="admin")
+def admin_download_profile(name):
+    profile = profiler.load(name)
+    if profile is None:
+        flash("Profile not found", "danger")
+        return redirect(url_for("admin_profiler"))
+    base = name[:-len(".json")]
+    if request.args.get("format") == "speedscope":
+        resp = make_response(json.dumps(speedscope(profile, base)))
+        resp.headers["Content-Type"] = "application/json"
+        resp.headers["Content-Disposition"] = f"attachment; filename={base}.speedscope.json"
+    else:
+        resp = make_response(collapsed_stacks(profile))
+        resp.headers["Content-Type"] = "text/plain"
+        resp.headers["Content-Disposition"] = f"attachment; filename={base}.folded"
+    return resp
+
+
+# Live tracking feed (Server-Sent Events)
+@app.route("/track/<tracking_id>/events")
+@login_required()
+def tracking_events(tracking_id):
+    try:
+        last_event_id = int(request.headers.get("Last-Event-ID", 0))
+    except ValueError:
+        last_event_id = 0
+
+    if not TRACKING_FEED:
+        return ("", 204)
+    if not tracking_filter.might_exist(tracking_id, shards):
+        return ("Shipment not found", 404)
+
+    # subscribe before reading the backlog so nothing published in between is lost
+    subscription = tracking_broker.subscribe(tracking_id)
+    try:
+        conn = booking_connection(tracking_id=tracking_id)
+        cursor = conn.cursor(dictionary=True)
+        try:
+            # archived shipments are found too; their history comes from the archive
+            booking_id, customer_id, archived, backlog = find_booking_events(cursor, tracking_id, last_event_id)
+        finally:
+            cursor.close()
+            conn.close()
+    except BaseException:
+        tracking_broker.unsubscribe(tracking_id, subscription)
+        raise
+
+    if not booking_id or (session.get("role") == "customer"
+                          and customer_id != get_customer_id(session.get("user_id"))):
+        tracking_broker.unsubscribe(tracking_id, subscription)
+        return ("Shipment not found", 404)
+
+    if archived:
+        # no more events will come: send what was missed, then 204 stops reconnects
+        tracking_broker.unsubscribe(tracking_id, subscription)
+        if not backlog:
+            return ("", 204)
+        body = backlog_stream(backlog)
+    else:
+        body = event_stream(tracking_broker, tracking_id, subscription, backlog)
+    resp = app.response_class(body, mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
 # Generate Reports
 @app.route("/admin/generate_reports", methods=["GET", "POST"])
 @login_required(role="admin")
+@admission.limit("reports")
 def admin_generate_reports():
     report_type = request.form.get("reportType") if request.method == "POST" else "all"
     date_from = request.form.get("dateFrom") if request.method == "POST" else None
     date_to = request.form.get("dateTo") if request.method == "POST" else None
 
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
     # --- Base query ---
     query = """
         SELECT b.id, 
@@ -993,10 +1613,8 @@ def admin_generate_reports():
                b.status, 
                b.booking_date, 
                b.total_amount,
-               u.username AS customer
+               b.customer_id
         FROM cargo_bookings b
-        JOIN customers c ON b.customer_id = c.id
-        JOIN users u ON c.user_id = u.id
         WHERE 1=1
     """
     params = []
@@ -1011,10 +1629,10 @@ def admin_generate_reports():
 
     query += " ORDER BY b.booking_date DESC"
 
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    # scatter-gather across shards, merged by booking_date
+    rows = shards.gather_rows(query, params, sort_key=lambda r: r["booking_date"], reverse=True)
+    for r in attach_customer(rows):
+        r["customer"] = r["username"]
 
     # --- CSV Header depends on report type ---
     if report_type == "financial":
@@ -1062,6 +1680,147 @@ def admin_generate_reports():
     })
 
 
+# ---------- CLI ----------
+@app.cli.command("archive-shipments")
+@click.option("--days", default=ARCHIVE_AFTER_DAYS, show_default=True,
+              help="Archive delivered/cancelled shipments older than this many days.")
+@click.option("--batch-size", default=500, show_default=True)
+def archive_shipments_command(days, batch_size):
+    """Move old delivered/cancelled shipments into the archive tables."""
+    archived = sum(shards.scatter(lambda conn: archive_shipments(conn, days, batch_size)))
+    click.echo(f"Archived {archived} shipments")
+
+
+@app.cli.command("init-shards")
+def init_shards_command():
+    """Copy the booking-side tables from the primary to every shard."""
+    if not shards.enabled:
+        raise click.ClickException("Set SHARDS to a JSON list of at least two databases.")
+    conn = get_db_connection()
+    try:
+        status = migrate.migration_status(conn)
+        if any(applied_at is None for _, _, applied_at in status):
+            raise click.ClickException("Run 'flask db-migrate' first, the shards copy the primary's tables.")
+        init_shards(conn, shards)
+    finally:
+        conn.close()
+    versions = [version for version, entry in migrate.available_migrations().items() if entry["scope"] == "shard"]
+    shards.scatter(lambda shard_conn: migrate.mark_applied(shard_conn, versions))
+    click.echo(f"Initialised {shards.count} shards")
+
+
+@app.cli.command("move-customer")
+@click.argument("customer_id", type=int)
+@click.argument("shard", type=int)
+@click.option("--settle", default=SHARD_DIRECTORY_TTL + 5, show_default=True,
+              help="Seconds to wait for workers to see the new placement before deleting the old rows.")
+def move_customer_command(customer_id, shard, settle):
+    """Move a customer's bookings, tracking updates and invoices to a higher shard."""
+    if not shards.enabled:
+        raise click.ClickException("Set SHARDS to a JSON list of at least two databases.")
+    conn = get_db_connection()
+    try:
+        move_customer(conn, shards, customer_id, shard, settle, log=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        conn.close()
+
+
+@app.cli.command("rebuild-tracking-filter")
+def rebuild_tracking_filter():
+    """Rebuild the tracking-id Bloom filter from the bookings and save its snapshot."""
+    tracking_filter.rebuild(shards)
+    click.echo(f"Tracking filter saved to {tracking_filter.snapshot_path}")
+
+
+@app.cli.command("db-migrate")
+@click.option("--target", type=int, default=None, help="Stop after this migration version.")
+def db_migrate_command(target):
+    """Apply pending migrations to the primary and the shard-scoped ones to every shard."""
+    conn = get_db_connection()
+    try:
+        done = migrate.migrate_up(conn, target, log=click.echo)
+    finally:
+        conn.close()
+    click.echo(f"primary: {len(done)} migration(s) applied")
+    for shard, conn, transform in shard_databases():
+        try:
+            if not is_initialised(conn):
+                click.echo(f"shard {shard}: skipped, run 'flask init-shards' to create its tables")
+                continue
+            done = migrate.migrate_up(conn, target, log=click.echo, scope="shard", transform=transform)
+        finally:
+            conn.close()
+        click.echo(f"shard {shard}: {len(done)} migration(s) applied")
+
+
+@app.cli.command("db-rollback")
+@click.option("--steps", default=1, show_default=True, help="Number of migrations to revert.")
+def db_rollback_command(steps):
+    """Revert the most recently applied migrations (on the primary and every shard)."""
+    conn = get_db_connection()
+    try:
+        done = migrate.migrate_down(conn, steps, log=click.echo)
+    finally:
+        conn.close()
+    click.echo(f"primary: {len(done)} migration(s) reverted")
+    for shard, conn, transform in shard_databases():
+        try:
+            reverted = migrate.migrate_down(conn, log=click.echo, versions=done, transform=transform)
+        finally:
+            conn.close()
+        click.echo(f"shard {shard}: {len(reverted)} migration(s) reverted")
+
+
+@app.cli.command("db-status")
+def db_status_command():
+    """List migrations and when they were applied, per database."""
+    conn = get_db_connection()
+    try:
+        rows = migrate.migration_status(conn)
+    finally:
+        conn.close()
+    click.echo("primary:")
+    for version, name, applied_at in rows:
+        click.echo(f"  {version:04d}_{name}  {applied_at or 'pending'}")
+    for shard, conn, _ in shard_databases():
+        try:
+            rows = migrate.migration_status(conn, scope="shard")
+        finally:
+            conn.close()
+        click.echo(f"shard {shard}:")
+        for version, name, applied_at in rows:
+            click.echo(f"  {version:04d}_{name}  {applied_at or 'pending'}")
+
+
+def shard_databases():
+    # (shard, connection, migration transform) per shard; none when unsharded
+    if not shards.enabled:
+        return
+    for shard in range(shards.count):
+        yield shard, shards.connect(shard), lambda sql, shard=shard: shard_statement(sql, shard)
+
+
+@app.cli.command("backfill-rollups")
+def backfill_rollups_command():
+    """Rebuild the daily analytics rollups from cargo_bookings and invoices, on every shard."""
+    shards.scatter(rollups.backfill)
+    click.echo("Rollups rebuilt")
+
+
+@app.cli.command("billing-run")
+@click.option("--month", default=None, help="Only bill deliveries in this month (YYYY-MM).")
+@click.option("--consolidate", is_flag=True, help="Also build one monthly invoice per customer.")
+@click.option("--chunk-size", default=1000, show_default=True)
+def billing_run_command(month, consolidate, chunk_size):
+    """Invoice all delivered bookings that have no invoice yet."""
+    results = shards.scatter(lambda conn: run_billing(conn, month, consolidate, chunk_size))
+    created = sum(r[0] for r in results)
+    consolidated = sum(r[1] for r in results)
+    click.echo(f"Created {created} invoices, consolidated {consolidated}")
+
+
 # ---------- START ----------
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,213 @@
+from datetime import datetime, timedelta
+
+# ---------- ARCHIVAL ----------
+# Delivered / cancelled bookings older than ARCHIVE_AFTER_DAYS are moved,
+# together with their tracking updates, invoices and consolidated invoice
+# links, into the *_archive tables (migrations/0006_archive_tables,
+# 0011_consolidated_invoice_archive) so the live tables stay small.
+
+ARCHIVABLE_STATUSES = ("delivered", "cancelled")
+
+# (bookings table, tracking table) pairs searched by tracking_id, live first
+LOOKUP_TABLES = (
+    ("cargo_bookings", "tracking_updates"),
+    ("cargo_bookings_archive", "tracking_updates_archive"),
+)
+
+# (invoices table, bookings table) pairs, live first
+INVOICE_TABLES = (
+    ("invoices", "cargo_bookings"),
+    ("invoices_archive", "cargo_bookings_archive"),
+)
+
+
+def archive_shipments(conn, older_than_days, batch_size=500):
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+    cursor = conn.cursor()
+    archived = 0
+    try:
+        while True:
+            # the row locks keep a concurrent status update or new tracking
+            # update (its foreign key locks the parent) out until the commit
+            cursor.execute("""
+                SELECT id FROM cargo_bookings
+                WHERE status IN (%s, %s) AND updated_at < %s
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE
+            """, (*ARCHIVABLE_STATUSES, cutoff, batch_size))
+            ids = [row[0] for row in cursor.fetchall()]
+            if not ids:
+                break
+
+            placeholders = ",".join(["%s"] * len(ids))
+            # children first into the archive, then delete children before parents
+            cursor.execute(
+                f"INSERT INTO cargo_bookings_archive SELECT * FROM cargo_bookings WHERE id IN ({placeholders})",
+                ids
+            )
+            cursor.execute(
+                f"INSERT INTO tracking_updates_archive SELECT * FROM tracking_updates WHERE booking_id IN ({placeholders})",
+                ids
+            )
+            cursor.execute(
+                f"INSERT INTO invoices_archive SELECT * FROM invoices WHERE booking_id IN ({placeholders})",
+                ids
+            )
+            # consolidated invoice links would go with the invoices (ON DELETE CASCADE)
+            cursor.execute(f"""
+                INSERT INTO consolidated_invoice_items_archive (invoice_id, consolidated_invoice_id)
+                SELECT ci.invoice_id, ci.consolidated_invoice_id
+                FROM consolidated_invoice_items ci
+                JOIN invoices i ON i.id = ci.invoice_id
+                WHERE i.booking_id IN ({placeholders})
+            """, ids)
+            cursor.execute(f"DELETE FROM invoices WHERE booking_id IN ({placeholders})", ids)
+            cursor.execute(f"DELETE FROM tracking_updates WHERE booking_id IN ({placeholders})", ids)
+            cursor.execute(f"DELETE FROM cargo_bookings WHERE id IN ({placeholders})", ids)
+            conn.commit()
+
+            archived += len(ids)
+            if len(ids) < batch_size:
+                break
+        _archive_settled_headers(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return archived
+
+
+def _archive_settled_headers(cursor):
+    # consolidated invoices that are no longer pending and whose invoices
+    # are all archived follow them; pending ones stay live and payable
+    settled = """
+        FROM consolidated_invoices c
+        WHERE c.status <> 'pending'
+          AND EXISTS (SELECT 1 FROM consolidated_invoice_items_archive ca WHERE ca.consolidated_invoice_id = c.id)
+          AND NOT EXISTS (SELECT 1 FROM consolidated_invoice_items ci WHERE ci.consolidated_invoice_id = c.id)
+    """
+    cursor.execute(f"INSERT INTO consolidated_invoices_archive SELECT c.* {settled}")
+    cursor.execute(f"DELETE c {settled}")
+
+
+def find_shipment(cursor, tracking_id):
+    # cursor must be a dictionary cursor; returns (booking, updates).
+    # The customer's name is not joined in, users may live in another database.
+    for bookings_table, updates_table in LOOKUP_TABLES:
+        cursor.execute(f"""
+            SELECT b.id AS booking_id, b.tracking_id, b.customer_id, b.sender_name, b.sender_address,
+                   b.recipient_name, b.recipient_address, b.status
+            FROM {bookings_table} b
+            WHERE b.tracking_id = %s
+        """, (tracking_id,))
+        booking = cursor.fetchone()
+        if booking:
+            booking["archived"] = bookings_table != "cargo_bookings"
+            cursor.execute(f"""
+                SELECT status, location, notes, updated_at
+                FROM {updates_table}
+                WHERE booking_id = %s
+                ORDER BY updated_at DESC
+            """, (booking["booking_id"],))
+            return booking, cursor.fetchall()
+    return None, []
+
+
+def find_customer_shipments(cursor, customer_id, tracking_ids):
+    # Bulk variant of find_shipment for one customer: one IN query for the
+    # bookings and one grouped query for their latest events per table; the
+    # archive is only searched for ids missing from the live table. Ids that
+    # belong to another customer are treated like unknown ones.
+    # Returns {tracking_id: booking with latest_* fields}.
+    found = {}
+    remaining = list(tracking_ids)
+    for bookings_table, updates_table in LOOKUP_TABLES:
+        if not remaining:
+            break
+        placeholders = ",".join(["%s"] * len(remaining))
+        cursor.execute(f"""
+            SELECT b.id AS booking_id, b.tracking_id, b.sender_name, b.recipient_name,
+                   b.recipient_address, b.status, b.booking_date, b.expected_delivery_date
+            FROM {bookings_table} b
+            WHERE b.customer_id = %s AND b.tracking_id IN ({placeholders})
+        """, [customer_id, *remaining])
+        bookings = {row["booking_id"]: row for row in cursor.fetchall()}
+        if not bookings:
+            continue
+
+        placeholders = ",".join(["%s"] * len(bookings))
+        cursor.execute(f"""
+            SELECT t.booking_id, t.status, t.location, t.notes, t.updated_at
+            FROM {updates_table} t
+            JOIN (
+                SELECT booking_id, MAX(id) AS id
+                FROM {updates_table}
+                WHERE booking_id IN ({placeholders})
+                GROUP BY booking_id
+            ) latest ON latest.id = t.id
+        """, list(bookings))
+        events = {row["booking_id"]: row for row in cursor.fetchall()}
+
+        for booking_id, booking in bookings.items():
+            event = events.get(booking_id, {})
+            booking["archived"] = bookings_table != "cargo_bookings"
+            booking["latest_status"] = event.get("status")
+            booking["latest_location"] = event.get("location")
+            booking["latest_notes"] = event.get("notes")
+            booking["latest_update"] = event.get("updated_at")
+            found[booking["tracking_id"].upper()] = booking
+        remaining = [tid for tid in remaining if tid not in found]
+    return found
+
+
+def find_customer_invoices(cursor, customer_id):
+    # every invoice of the customer, live and archived, newest first;
+    # cursor must be a dictionary cursor
+    parts = [f"""
+        SELECT i.id, i.booking_id, i.amount, i.status, i.issued_at, i.paid_at,
+               b.tracking_id, b.destination_city, {int(invoices_table != "invoices")} AS archived
+        FROM {invoices_table} i
+        JOIN {bookings_table} b ON i.booking_id = b.id
+        WHERE b.customer_id = %s
+    """ for invoices_table, bookings_table in INVOICE_TABLES]
+    cursor.execute(" UNION ALL ".join(parts) + " ORDER BY issued_at DESC", (customer_id,) * len(parts))
+    return cursor.fetchall()
+
+
+def find_customer_invoice(cursor, customer_id, invoice_id):
+    # one invoice with its booking, live first; None if it is not the customer's
+    for invoices_table, bookings_table in INVOICE_TABLES:
+        cursor.execute(f"""
+            SELECT i.*, b.tracking_id, b.sender_name, b.recipient_name, b.customer_id
+            FROM {invoices_table} i
+            JOIN {bookings_table} b ON i.booking_id = b.id
+            WHERE i.id = %s AND b.customer_id = %s
+        """, (invoice_id, customer_id))
+        invoice = cursor.fetchone()
+        if invoice:
+            invoice["archived"] = invoices_table != "invoices"
+            return invoice
+    return None
+
+
+def find_booking_events(cursor, tracking_id, after_event_id):
+    # (booking id, customer id, archived, tracking updates with id > after_event_id)
+    # for the feed; (None, None, False, []) when the tracking id is unknown
+    for bookings_table, updates_table in LOOKUP_TABLES:
+        cursor.execute(f"SELECT id, customer_id FROM {bookings_table} WHERE tracking_id = %s", (tracking_id,))
+        booking = cursor.fetchone()
+        if booking:
+            events = []
+            if after_event_id:
+                cursor.execute(f"""
+                    SELECT id, status, location, notes, updated_at
+                    FROM {updates_table}
+                    WHERE booking_id = %s AND id > %s
+                    ORDER BY id
+                """, (booking["id"], after_event_id))
+                events = cursor.fetchall()
+            return booking["id"], booking["customer_id"], bookings_table != "cargo_bookings", events
+    return None, None, False, []
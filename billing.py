@@ -0,0 +1,186 @@
+from datetime import date
+
+# ---------- BILLING RUN ----------
+# Invoices every delivered booking that has no invoice yet. The anti-join
+# makes a rerun a no-op, and a named lock stops two runs on the same
+# database overlapping (lock names are server-wide, so the lock is named
+# per database and shards sharing a server can be billed in parallel).
+
+BILLING_LOCK = "cargo_billing_run"
+
+# delivery date used to bucket bookings into months
+DELIVERY_DATE = "COALESCE(b.actual_delivery_date, DATE(b.updated_at))"
+
+
+def month_bounds(month):
+    # "YYYY-MM" -> (first day, first day of next month)
+    year, mon = (int(part) for part in month.split("-"))
+    start = date(year, mon, 1)
+    end = date(year + 1, 1, 1) if mon == 12 else date(year, mon + 1, 1)
+    return start, end
+
+
+def _period_filter(period):
+    if not period:
+        return "", ()
+    return f" AND {DELIVERY_DATE} >= %s AND {DELIVERY_DATE} < %s", period
+
+
+def create_missing_invoices(cursor, conn, period=None, chunk_size=1000):
+    # keyset chunks: a shard's ids can be far apart (customers moved in
+    # from other shards keep their ids), so chunks follow the ids that exist
+    period_sql, period_params = _period_filter(period)
+    created = 0
+    last_id = -1
+    while True:
+        cursor.execute(f"""
+            SELECT MAX(id) FROM (
+                SELECT b.id
+                FROM cargo_bookings b
+                LEFT JOIN invoices i ON i.booking_id = b.id
+                WHERE b.status = 'delivered' AND i.id IS NULL AND b.id > %s{period_sql}
+                ORDER BY b.id LIMIT %s
+            ) chunk
+        """, (last_id, *period_params, chunk_size))
+        chunk_end = cursor.fetchone()[0]
+        if chunk_end is None:
+            return created
+        cursor.execute(f"""
+            INSERT INTO invoices (booking_id, amount, status)
+            SELECT b.id, COALESCE(b.total_amount, 0), 'pending'
+            FROM cargo_bookings b
+            LEFT JOIN invoices i ON i.booking_id = b.id
+            WHERE b.status = 'delivered' AND i.id IS NULL
+              AND b.id > %s AND b.id <= %s{period_sql}
+        """, (last_id, chunk_end, *period_params))
+        created += cursor.rowcount
+        conn.commit()
+        last_id = chunk_end
+
+
+def consolidate_month(cursor, conn, period):
+    # one consolidated invoice per customer for invoices of bookings delivered
+    # in the month. Invoices are only added to a header while it is pending,
+    # and only pending totals are recomputed: once a header is paid (or
+    # overdue, cancelled) its amount is what the customer was billed.
+    period_start, period_end = period
+    cursor.execute(f"""
+        INSERT IGNORE INTO consolidated_invoices (customer_id, period_start)
+        SELECT DISTINCT b.customer_id, %s
+        FROM invoices i
+        JOIN cargo_bookings b ON i.booking_id = b.id
+        LEFT JOIN consolidated_invoice_items ci ON ci.invoice_id = i.id
+        WHERE ci.invoice_id IS NULL AND i.status <> 'cancelled'
+          AND {DELIVERY_DATE} >= %s AND {DELIVERY_DATE} < %s
+          AND NOT EXISTS (
+              SELECT 1 FROM consolidated_invoices_archive a
+              WHERE a.customer_id = b.customer_id AND a.period_start = %s
+          )
+    """, (period_start, period_start, period_end, period_start))
+
+    cursor.execute(f"""
+        INSERT INTO consolidated_invoice_items (invoice_id, consolidated_invoice_id)
+        SELECT i.id, cons.id
+        FROM invoices i
+        JOIN cargo_bookings b ON i.booking_id = b.id
+        JOIN consolidated_invoices cons
+          ON cons.customer_id = b.customer_id AND cons.period_start = %s AND cons.status = 'pending'
+        LEFT JOIN consolidated_invoice_items ci ON ci.invoice_id = i.id
+        WHERE ci.invoice_id IS NULL AND i.status <> 'cancelled'
+          AND {DELIVERY_DATE} >= %s AND {DELIVERY_DATE} < %s
+    """, (period_start, period_start, period_end))
+    linked = cursor.rowcount
+
+    # archived invoices still count towards their header's total
+    cursor.execute("""
+        UPDATE consolidated_invoices cons
+        JOIN (
+            SELECT items.consolidated_invoice_id, SUM(items.amount) AS total
+            FROM (
+                SELECT ci.consolidated_invoice_id, i.amount
+                FROM consolidated_invoice_items ci
+                JOIN invoices i ON i.id = ci.invoice_id
+                UNION ALL
+                SELECT ca.consolidated_invoice_id, ia.amount
+                FROM consolidated_invoice_items_archive ca
+                JOIN invoices_archive ia ON ia.id = ca.invoice_id
+            ) items
+            GROUP BY items.consolidated_invoice_id
+        ) totals ON totals.consolidated_invoice_id = cons.id
+        SET cons.amount = totals.total
+        WHERE cons.period_start = %s AND cons.status = 'pending'
+    """, (period_start,))
+    conn.commit()
+    return linked
+
+
+def run_billing(conn, month=None, consolidate=False, chunk_size=1000):
+    if consolidate and not month:
+        raise ValueError("Consolidation needs a billing month (YYYY-MM).")
+    period = month_bounds(month) if month else None
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(CONCAT(%s, ':', DATABASE()), 0)", (BILLING_LOCK,))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("Another billing run is in progress.")
+        try:
+            created = create_missing_invoices(cursor, conn, period, chunk_size)
+            consolidated = consolidate_month(cursor, conn, period) if consolidate else 0
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(CONCAT(%s, ':', DATABASE()))", (BILLING_LOCK,))
+            cursor.fetchone()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return created, consolidated
+
+
+# ---------- CUSTOMER STATEMENTS ----------
+# Consolidated invoices as the customer sees them, live and archived.
+# Cursors must be dictionary cursors.
+
+STATEMENT_TABLES = ("consolidated_invoices", "consolidated_invoices_archive")
+# (links, invoices, bookings), live and archived
+STATEMENT_ITEM_TABLES = (
+    ("consolidated_invoice_items", "invoices", "cargo_bookings"),
+    ("consolidated_invoice_items_archive", "invoices_archive", "cargo_bookings_archive"),
+)
+
+
+def customer_statements(cursor, customer_id):
+    parts = [f"""
+        SELECT c.id, c.period_start, c.amount, c.status, c.issued_at, c.paid_at
+        FROM {headers} c
+        WHERE c.customer_id = %s
+    """ for headers in STATEMENT_TABLES]
+    cursor.execute(" UNION ALL ".join(parts) + " ORDER BY period_start DESC", (customer_id,) * len(parts))
+    return cursor.fetchall()
+
+
+def customer_statement(cursor, customer_id, statement_id):
+    # (header, invoices) or (None, []) if it is not the customer's
+    for headers in STATEMENT_TABLES:
+        cursor.execute(f"""
+            SELECT id, period_start, amount, status, issued_at, paid_at
+            FROM {headers}
+            WHERE id = %s AND customer_id = %s
+        """, (statement_id, customer_id))
+        statement = cursor.fetchone()
+        if statement:
+            break
+    else:
+        return None, []
+
+    # a header's invoices may be partly archived whether or not it is
+    parts = [f"""
+        SELECT i.id, i.amount, i.status, b.tracking_id, b.destination_city, {DELIVERY_DATE} AS delivered_on
+        FROM {items} ci
+        JOIN {invoices} i ON i.id = ci.invoice_id
+        JOIN {bookings} b ON b.id = i.booking_id
+        WHERE ci.consolidated_invoice_id = %s
+    """ for items, invoices, bookings in STATEMENT_ITEM_TABLES]
+    cursor.execute(" UNION ALL ".join(parts) + " ORDER BY delivered_on, id", (statement_id,) * len(parts))
+    return statement, cursor.fetchall()
@@ -0,0 +1,137 @@
+import re
+import zlib
+
+from flask import request
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip only without it
+    zstandard = None
+
+# ---------- RESPONSE COMPRESSION ----------
+# HTML pages, CSV exports and JSON are compressed with zstd or gzip,
+# whichever the client prefers (zstd wins ties). Buffered responses below
+# min_size are left alone. Streamed responses are compressed as they are
+# produced and flushed every flush_size input bytes, so the client still
+# receives rows incrementally without paying a flush per tiny chunk. PDFs,
+# images and anything already encoded are passed through.
+
+COMPRESSIBLE_TYPES = {
+    "text/html", "text/csv", "text/plain", "text/css", "text/javascript",
+    "application/json", "application/javascript", "application/xml", "image/svg+xml",
+}
+
+
+def accepted_encodings(header):
+    # "gzip;q=0.8, zstd" -> {"gzip": 0.8, "zstd": 1.0}
+    accepted = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        match = re.search(r"q\s*=\s*([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def choose_encoding(header):
+    accepted = accepted_encodings(header)
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for name in (("zstd", "gzip") if zstandard else ("gzip",)):
+        q = accepted.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding, level):
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            # wbits 16+ -> gzip header and trailer
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(self._flush_mode)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+def _compress_stream(chunks, encoding, level, flush_size):
+    compressor = _Compressor(encoding, level)
+    pending = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            if not chunk:
+                continue
+            data = compressor.compress(chunk)
+            pending += len(chunk)
+            if pending >= flush_size:
+                data += compressor.flush()
+                pending = 0
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+
+
+def compress_bytes(data, encoding, level):
+    compressor = _Compressor(encoding, level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def _should_compress(request, response):
+    if request.method == "HEAD" or response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if "Content-Encoding" in response.headers or "Content-Range" in response.headers:
+        return False
+    return response.mimetype in COMPRESSIBLE_TYPES
+
+
+def init_compression(app, min_size=1024, level=6, zstd_level=3, flush_size=16384):
+    @app.after_request
+    def compress_response(response):
+        if not _should_compress(request, response):
+            return response
+        encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+        response.vary.add("Accept-Encoding")
+        if encoding is None:
+            return response
+        chosen_level = zstd_level if encoding == "zstd" else level
+
+        if response.is_streamed:
+            # generator bodies: compress as they are produced
+            response.response = _compress_stream(response.response, encoding, chosen_level, flush_size)
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            response.set_data(compress_bytes(data, encoding, chosen_level))
+        response.headers["Content-Encoding"] = encoding
+        # a strong ETag no longer matches the encoded body
+        if response.headers.get("ETag", "").startswith('"'):
+            response.headers["ETag"] = "W/" + response.headers["ETag"]
+        return response
+
+    return compress_response
@@ -0,0 +1,33 @@
+import multiprocessing
+import os
+
+# ---------- PRODUCTION SERVER ----------
+# gunicorn -c gunicorn.conf.py wsgi:app
+# Graceful reload (new code, no dropped requests): kill -HUP <master pid>
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# each /track/<id>/events (SSE) subscriber would hold a thread here, so this
+# server answers the feed with 204; run the gevent SSE server
+# (gunicorn.sse.conf.py) alongside and route /track/<id>/events to it
+worker_class = os.environ.get("WORKER_CLASS", "gthread")
+threads = int(os.environ.get("WEB_THREADS", 8))
+preload_app = True
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+max_requests = 5000
+max_requests_jitter = 500
+
+# one pooled connection per thread; the app sizes its heavy-request budget
+# (admission control) from the thread count
+os.environ.setdefault("DB_POOL_SIZE", str(threads))
+os.environ.setdefault("WEB_THREADS", str(threads))
+
+
+def post_fork(server, worker):
+    from app import reset_db_pool, warm_up
+
+    reset_db_pool()
+    warm_up()
+    worker.log.info("Worker %s ready", worker.pid)
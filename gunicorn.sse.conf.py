@@ -0,0 +1,38 @@
+import multiprocessing
+import os
+
+# ---------- SSE SERVER ----------
+# gunicorn -c gunicorn.sse.conf.py sse_wsgi:app
+# Serves the live tracking feed (/track/<tracking_id>/events) on gevent, so
+# an idle subscriber costs a greenlet instead of a gthread worker thread.
+# Route only that path here from the reverse proxy, e.g. for nginx:
+#   location ~ ^/track/[^/]+/events$ { proxy_pass http://sse; proxy_buffering off; }
+# Status changes are made by the main server, so both must share
+# TRACKING_BROKER_URL (redis://...).
+
+bind = os.environ.get("SSE_BIND", "0.0.0.0:8001")
+workers = int(os.environ.get("SSE_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gevent"
+worker_connections = int(os.environ.get("SSE_WORKER_CONNECTIONS", 2000))
+# the app is imported per worker, after sse_wsgi has monkey-patched
+preload_app = False
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+# greenlets only hold a connection while reading the backlog; the pool
+# raises instead of waiting when it is exhausted, so connect per request
+os.environ.setdefault("DB_POOL_SIZE", "0")
+
+
+def on_starting(server):
+    if not (os.environ.get("TRACKING_BROKER_URL") or "").startswith("redis"):
+        raise RuntimeError("The SSE server needs TRACKING_BROKER_URL=redis://... shared with the web server.")
+
+
+def post_worker_init(worker):
+    # post_fork runs before the app is imported here; warm up once it is loaded
+    from app import warm_up
+
+    warm_up()
+    worker.log.info("SSE worker %s ready", worker.pid)
@@ -0,0 +1,226 @@
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# ---------- SHIPPING LABELS ----------
+# One 4x6" label per page with a Code128 barcode of the tracking_id.
+# Chunks of labels are rendered to temporary PDFs in worker processes,
+# merged on disk and streamed back, so a large batch never sits in memory.
+# The merge copies one chunk file at a time into the output, renumbering its
+# objects and hanging its page tree under a shared root; only the object
+# offsets of the output are kept. The pool uses the forkserver start method
+# because the web workers run threads (see onboarding.py).
+
+LABEL_COLUMNS = ("tracking_id", "sender_name", "sender_address", "sender_phone",
+                 "recipient_name", "recipient_address", "recipient_phone",
+                 "service_type", "weight", "origin_city", "destination_city")
+CHUNK_SIZE = 250
+STREAM_BLOCK = 64 * 1024
+MAX_LABELS = 10000
+
+
+def check_label_count(count, limit=MAX_LABELS):
+    if count > limit:
+        raise ValueError(f"More than {limit} bookings match that selection; narrow it down.")
+
+
+def select_label_rows(conn, status=None, origin_city=None, booking_ids=None, limit=MAX_LABELS):
+    # one row past the limit is fetched so a truncated selection is an error
+    query = f"SELECT {', '.join(LABEL_COLUMNS)} FROM cargo_bookings WHERE 1=1"
+    params = []
+    if booking_ids:
+        query += f" AND id IN ({','.join(['%s'] * len(booking_ids))})"
+        params.extend(booking_ids)
+    if status:
+        query += " AND status = %s"
+        params.append(status)
+    if origin_city:
+        query += " AND origin_city = %s"
+        params.append(origin_city)
+    query += " ORDER BY id LIMIT %s"
+    params.append(limit + 1)
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    check_label_count(len(rows), limit)
+    return rows
+
+
+def _draw_block(pdf, x, y, width, title, name, address, phone):
+    from reportlab.lib.utils import simpleSplit
+
+    pdf.setFont("Helvetica-Bold", 8)
+    pdf.drawString(x, y, title)
+    pdf.setFont("Helvetica-Bold", 11)
+    pdf.drawString(x, y - 14, name or "")
+    pdf.setFont("Helvetica", 9)
+    line_y = y - 27
+    for line in simpleSplit(address or "", "Helvetica", 9, width)[:4]:
+        pdf.drawString(x, line_y, line)
+        line_y -= 11
+    if phone:
+        pdf.drawString(x, line_y, f"Tel: {phone}")
+
+
+def render_chunk(args):
+    # runs in a worker process: (rows, output path) -> output path
+    rows, path = args
+    from reportlab.graphics.barcode.code128 import Code128
+    from reportlab.lib.units import inch
+    from reportlab.pdfgen import canvas
+
+    width, height = 4 * inch, 6 * inch
+    margin = 0.25 * inch
+    pdf = canvas.Canvas(path, pagesize=(width, height), pageCompression=1)
+    for row in rows:
+        label = dict(zip(LABEL_COLUMNS, row))
+
+        barcode = Code128(label["tracking_id"], barHeight=0.9 * inch, barWidth=1.4)
+        barcode.drawOn(pdf, (width - barcode.width) / 2, height - margin - 0.9 * inch)
+        pdf.setFont("Helvetica-Bold", 14)
+        pdf.drawCentredString(width / 2, height - margin - 1.15 * inch, label["tracking_id"])
+
+        pdf.line(margin, height - 1.55 * inch, width - margin, height - 1.55 * inch)
+        _draw_block(pdf, margin, height - 1.8 * inch, width - 2 * margin, "FROM",
+                    label["sender_name"], label["sender_address"], label["sender_phone"])
+        pdf.line(margin, height - 3.2 * inch, width - margin, height - 3.2 * inch)
+        _draw_block(pdf, margin, height - 3.45 * inch, width - 2 * margin, "TO",
+                    label["recipient_name"], label["recipient_address"], label["recipient_phone"])
+
+        pdf.line(margin, 0.9 * inch, width - margin, 0.9 * inch)
+        pdf.setFont("Helvetica", 9)
+        pdf.drawString(margin, 0.65 * inch, f"Service: {(label['service_type'] or 'standard').title()}")
+        pdf.drawString(margin, 0.45 * inch, f"Weight: {label['weight'] or '-'} kg")
+        lane = f"{label['origin_city'] or '?'} -> {label['destination_city'] or '?'}"
+        pdf.drawRightString(width - margin, 0.65 * inch, lane)
+        pdf.showPage()
+    pdf.save()
+    return path
+
+
+# ---------- merging chunk PDFs ----------
+# Handles the files reportlab writes: a classic xref table, "N 0 obj"
+# objects, direct /Length values on streams.
+OBJ_HEADER = re.compile(rb"(\d+) 0 obj\s*")
+REFERENCE = re.compile(rb"\b(\d+) 0 R\b")
+
+
+def _read_objects(data):
+    # -> ({object number: (dictionary bytes, stream bytes or None)}, root, info)
+    xref = data.rindex(b"startxref")
+    start = int(data[xref + 9:].split()[0])
+    table, trailer = data[start:].split(b"trailer", 1)
+    tokens = table.split()[1:]
+    offsets = {}
+    while tokens:
+        first, count = int(tokens[0]), int(tokens[1])
+        entries, tokens = tokens[2:2 + 3 * count], tokens[2 + 3 * count:]
+        for i in range(count):
+            if entries[3 * i + 2] == b"n":
+                offsets[first + i] = int(entries[3 * i])
+
+    objects = {}
+    for number, offset in offsets.items():
+        header = OBJ_HEADER.match(data, offset)
+        end = data.index(b"endobj", header.end())
+        stream_at = data.find(b"stream", header.end(), end)
+        if stream_at < 0:
+            objects[number] = (data[header.end():end].rstrip(), None)
+            continue
+        head = data[header.end():stream_at].rstrip()
+        length = int(re.search(rb"/Length (\d+)", head).group(1))
+        body = stream_at + len(b"stream")
+        body += 2 if data[body:body + 2] == b"\r\n" else 1
+        objects[number] = (head, data[body:body + length])
+
+    root = int(re.search(rb"/Root (\d+) 0 R", trailer).group(1))
+    info = re.search(rb"/Info (\d+) 0 R", trailer)
+    return objects, root, int(info.group(1)) if info else None
+
+
+def concat_pdfs(paths, output):
+    # offsets[n] is the position of object n; 1 and 2 are the merged
+    # catalog and page tree root, written last
+    offsets = [0, None, None]
+    kids = []
+    total_pages = 0
+    with open(output, "wb") as out:
+        out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+        def write_object(head, stream=None):
+            offsets.append(out.tell())
+            out.write(b"%d 0 obj\n" % (len(offsets) - 1) + head + b"\n")
+            if stream is not None:
+                out.write(b"stream\n" + stream + b"\nendstream\n")
+            out.write(b"endobj\n")
+
+        for path in paths:
+            with open(path, "rb") as fh:
+                objects, root, info = _read_objects(fh.read())
+            base = len(offsets) - 1
+            pages = int(re.search(rb"/Pages (\d+) 0 R", objects[root][0]).group(1))
+            renumber = lambda m: b"%d 0 R" % (int(m.group(1)) + base)  # noqa: E731
+            for number in range(1, max(objects) + 1):
+                head, stream = objects.get(number, (b"null", None))
+                if number in (root, info):
+                    head, stream = b"null", None  # replaced by the merged catalog
+                head = REFERENCE.sub(renumber, head)
+                if number == pages:
+                    head = head.replace(b"<<", b"<< /Parent 2 0 R", 1)
+                    total_pages += int(re.search(rb"/Count (\d+)", head).group(1))
+                    kids.append(number + base)
+                write_object(head, stream)
+
+        offsets[1] = out.tell()
+        out.write(b"1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n")
+        offsets[2] = out.tell()
+        out.write(b"2 0 obj\n<< /Type /Pages /Kids [ %s ] /Count %d >>\nendobj\n"
+                  % (b" ".join(b"%d 0 R" % kid for kid in kids), total_pages))
+
+        xref = out.tell()
+        out.write(b"xref\n0 %d\n0000000000 65535 f \n" % len(offsets))
+        for offset in offsets[1:]:
+            out.write(b"%010d 00000 n \n" % offset)
+        out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets), xref))
+
+
+def build_labels_pdf(rows, workers=None, chunk_size=CHUNK_SIZE):
+    # returns the path of a temporary PDF; the caller streams and deletes it
+    workdir = tempfile.mkdtemp(prefix="labels_")
+    try:
+        chunks = [(rows[i:i + chunk_size], os.path.join(workdir, f"chunk_{i // chunk_size:05d}.pdf"))
+                  for i in range(0, len(rows), chunk_size)]
+        if len(chunks) == 1:
+            return render_chunk(chunks[0]), workdir
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver")) as pool:
+            paths = list(pool.map(render_chunk, chunks))
+
+        output = os.path.join(workdir, "labels.pdf")
+        concat_pdfs(paths, output)
+        for path in paths:
+            os.remove(path)
+        return output, workdir
+    except BaseException:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+
+
+def stream_file(path, workdir):
+    try:
+        with open(path, "rb") as fh:
+            while True:
+                block = fh.read(STREAM_BLOCK)
+                if not block:
+                    break
+                yield block
+    finally:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import re
+
+from sqlscript import sql_statements
+
+# ---------- SCHEMA MIGRATIONS ----------
+# migrations/NNNN_name.up.sql and NNNN_name.down.sql, applied in version
+# order and recorded in the schema_migrations ledger. Index changes use
+# ALGORITHM=INPLACE, LOCK=NONE so they run while the app keeps writing.
+# MySQL DDL commits implicitly, so each migration is recorded right after
+# its own statements succeed.
+#
+# A "-- scope: primary" line in the up script marks a migration for the
+# directory tables (users, customers, employees, sequences); anything else is
+# scope "shard" (the booking tables). The primary database receives every
+# migration; with SHARDS set each shard additionally receives the
+# shard-scoped ones, through a transform that adapts their CREATE TABLE
+# statements (sharding.shard_statement). Every database keeps its own
+# ledger.
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.(up|down)\.sql$")
+MIGRATION_SCOPE = re.compile(r"^--\s*scope:\s*(primary|shard)\s*$", re.M)
+MIGRATION_LOCK = "cargo_schema_migrations"
+
+LEDGER_DDL = """
+    CREATE TABLE IF NOT EXISTS `schema_migrations` (
+      `version` int(11) NOT NULL,
+      `name` varchar(100) NOT NULL,
+      `checksum` char(64) NOT NULL,
+      `applied_at` timestamp NOT NULL DEFAULT current_timestamp(),
+      PRIMARY KEY (`version`)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci
+"""
+
+
+class MigrationError(Exception):
+    pass
+
+
+def available_migrations(directory=MIGRATIONS_DIR):
+    # version -> {"name", "up", "down"} (paths)
+    found = {}
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        version, name, direction = int(match.group(1)), match.group(2), match.group(3)
+        entry = found.setdefault(version, {"name": name})
+        if entry["name"] != name:
+            raise MigrationError(f"Migration {version:04d} has two names: {entry['name']}, {name}")
+        entry[direction] = os.path.join(directory, filename)
+    for version, entry in found.items():
+        if "up" not in entry:
+            raise MigrationError(f"Migration {version:04d}_{entry['name']} has no up script")
+        entry["scope"] = _scope(entry["up"])
+    return dict(sorted(found.items()))
+
+
+def _scope(path):
+    with open(path, encoding="utf-8") as fh:
+        match = MIGRATION_SCOPE.search(fh.read())
+    return match.group(1) if match else "shard"
+
+
+def _checksum(path):
+    with open(path, "rb") as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+def _run_script(cursor, path, transform=None):
+    with open(path, encoding="utf-8") as fh:
+        for statement in sql_statements(fh.read()):
+            cursor.execute(transform(statement) if transform else statement)
+
+
+def applied_migrations(cursor):
+    cursor.execute(LEDGER_DDL)
+    cursor.execute("SELECT version, name, checksum, applied_at FROM schema_migrations ORDER BY version")
+    return {row[0]: row for row in cursor.fetchall()}
+
+
+class _Locked:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    # GET_LOCK names are server-wide; several databases may share a server
+    def __enter__(self):
+        self.cursor.execute("SELECT GET_LOCK(CONCAT(%s, ':', DATABASE()), 10)", (MIGRATION_LOCK,))
+        if self.cursor.fetchone()[0] != 1:
+            raise MigrationError("Another migration run holds the lock.")
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cursor.execute("SELECT RELEASE_LOCK(CONCAT(%s, ':', DATABASE()))", (MIGRATION_LOCK,))
+        self.cursor.fetchone()
+
+
+def _in_scope(migrations, scope):
+    return {version: entry for version, entry in migrations.items()
+            if scope is None or entry["scope"] == scope}
+
+
+def migrate_up(conn, target=None, log=print, scope=None, transform=None):
+    # scope None applies every migration (the primary), "shard" only shard-scoped ones
+    migrations = _in_scope(available_migrations(), scope)
+    cursor = conn.cursor()
+    try:
+        with _Locked(cursor):
+            applied = applied_migrations(cursor)
+            for version, row in applied.items():
+                entry = migrations.get(version)
+                if entry and _checksum(entry["up"]) != row[2]:
+                    raise MigrationError(f"Migration {version:04d}_{row[1]} was edited after being applied")
+
+            done = []
+            for version, entry in migrations.items():
+                if version in applied or (target is not None and version > target):
+                    continue
+                log(f"Applying {version:04d}_{entry['name']}")
+                _run_script(cursor, entry["up"], transform)
+                record_migration(cursor, version, entry)
+                conn.commit()
+                done.append(version)
+            return done
+    finally:
+        cursor.close()
+
+
+def record_migration(cursor, version, entry):
+    cursor.execute(
+        "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s,%s,%s)",
+        (version, entry["name"], _checksum(entry["up"]))
+    )
+
+
+def mark_applied(conn, versions):
+    # records migrations whose effect was copied from another database
+    # (flask init-shards) without running them
+    migrations = available_migrations()
+    cursor = conn.cursor()
+    try:
+        with _Locked(cursor):
+            applied = applied_migrations(cursor)
+            for version in versions:
+                if version not in applied:
+                    record_migration(cursor, version, migrations[version])
+            conn.commit()
+    finally:
+        cursor.close()
+
+
+def migrate_down(conn, steps=1, log=print, versions=None, transform=None):
+    # reverts the last `steps` applied migrations, or exactly `versions` where applied
+    migrations = available_migrations()
+    cursor = conn.cursor()
+    try:
+        with _Locked(cursor):
+            applied = applied_migrations(cursor)
+            if versions is None:
+                versions = sorted(applied, reverse=True)[:steps]
+            else:
+                versions = sorted((v for v in versions if v in applied), reverse=True)
+            done = []
+            for version in versions:
+                entry = migrations.get(version)
+                if not entry or "down" not in entry:
+                    raise MigrationError(f"Migration {version:04d} has no down script")
+                log(f"Reverting {version:04d}_{entry['name']}")
+                _run_script(cursor, entry["down"], transform)
+                cursor.execute("DELETE FROM schema_migrations WHERE version=%s", (version,))
+                conn.commit()
+                done.append(version)
+            return done
+    finally:
+        cursor.close()
+
+
+def migration_status(conn, scope=None):
+    # [(version, name, applied_at or None)]
+    cursor = conn.cursor()
+    try:
+        applied = applied_migrations(cursor)
+    finally:
+        cursor.close()
+    return [(version, entry["name"], applied[version][3] if version in applied else None)
+            for version, entry in _in_scope(available_migrations(), scope).items()]
@@ -0,0 +1,3 @@
+ALTER TABLE `cargo_bookings`
+  DROP KEY `idx_cargo_customer_date`,
+  ALGORITHM=INPLACE, LOCK=NONE;
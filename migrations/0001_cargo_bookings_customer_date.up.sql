@@ -0,0 +1,4 @@
+-- customer_dashboard / customer_view_invoices: WHERE customer_id ORDER BY booking_date
+ALTER TABLE `cargo_bookings`
+  ADD KEY `idx_cargo_customer_date` (`customer_id`, `booking_date`),
+  ALGORITHM=INPLACE, LOCK=NONE;
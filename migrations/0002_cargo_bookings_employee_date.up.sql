@@ -0,0 +1,4 @@
+-- employee_shipment_history: WHERE assigned_employee_id ORDER BY booking_date
+ALTER TABLE `cargo_bookings`
+  ADD KEY `idx_cargo_employee_date` (`assigned_employee_id`, `booking_date`),
+  ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,3 @@
+ALTER TABLE `tracking_updates`
+  DROP KEY `idx_tracking_booking_time`,
+  ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,4 @@
+-- shipment timelines: WHERE booking_id ORDER BY updated_at
+ALTER TABLE `tracking_updates`
+  ADD KEY `idx_tracking_booking_time` (`booking_id`, `updated_at`),
+  ALGORITHM=INPLACE, LOCK=NONE;
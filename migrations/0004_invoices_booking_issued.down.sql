@@ -0,0 +1,3 @@
+ALTER TABLE `invoices`
+  DROP KEY `idx_invoices_booking_issued`,
+  ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,4 @@
+-- invoice lists: JOIN on booking_id ORDER BY issued_at
+ALTER TABLE `invoices`
+  ADD KEY `idx_invoices_booking_issued` (`booking_id`, `issued_at`),
+  ALGORITHM=INPLACE, LOCK=NONE;
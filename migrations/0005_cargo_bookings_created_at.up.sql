@@ -0,0 +1,4 @@
+-- admin_dashboard: latest bookings ORDER BY created_at DESC LIMIT 10
+ALTER TABLE `cargo_bookings`
+  ADD KEY `idx_cargo_created` (`created_at`),
+  ALGORITHM=INPLACE, LOCK=NONE;
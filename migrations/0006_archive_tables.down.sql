@@ -0,0 +1,4 @@
+-- scope: shard
+DROP TABLE IF EXISTS `invoices_archive`;
+DROP TABLE IF EXISTS `tracking_updates_archive`;
+DROP TABLE IF EXISTS `cargo_bookings_archive`;
@@ -0,0 +1,12 @@
+-- scope: shard
+-- Archive tables for delivered / cancelled shipments (archive.py).
+-- Same column layout as the live tables so rows can be moved with
+-- INSERT ... SELECT *, stored compressed since they are rarely read.
+CREATE TABLE IF NOT EXISTS `cargo_bookings_archive` LIKE `cargo_bookings`;
+ALTER TABLE `cargo_bookings_archive` ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8;
+
+CREATE TABLE IF NOT EXISTS `tracking_updates_archive` LIKE `tracking_updates`;
+ALTER TABLE `tracking_updates_archive` ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8;
+
+CREATE TABLE IF NOT EXISTS `invoices_archive` LIKE `invoices`;
+ALTER TABLE `invoices_archive` ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8;
@@ -0,0 +1,24 @@
+-- scope: shard
+-- Monthly consolidated invoices (billing.py): one header per customer and
+-- month, linked to the per-booking invoices it covers.
+CREATE TABLE IF NOT EXISTS `consolidated_invoices` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `customer_id` int(11) NOT NULL,
+  `period_start` date NOT NULL,
+  `amount` decimal(12,2) NOT NULL DEFAULT 0.00,
+  `status` enum('paid','pending','overdue','cancelled') DEFAULT 'pending',
+  `issued_at` timestamp NOT NULL DEFAULT current_timestamp(),
+  `paid_at` timestamp NULL DEFAULT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `customer_period` (`customer_id`, `period_start`),
+  CONSTRAINT `consolidated_invoices_ibfk_1` FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE IF NOT EXISTS `consolidated_invoice_items` (
+  `invoice_id` int(11) NOT NULL,
+  `consolidated_invoice_id` int(11) NOT NULL,
+  PRIMARY KEY (`invoice_id`),
+  KEY `consolidated_invoice_id` (`consolidated_invoice_id`),
+  CONSTRAINT `consolidated_invoice_items_ibfk_1` FOREIGN KEY (`invoice_id`) REFERENCES `invoices` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `consolidated_invoice_items_ibfk_2` FOREIGN KEY (`consolidated_invoice_id`) REFERENCES `consolidated_invoices` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
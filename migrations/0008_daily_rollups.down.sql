@@ -0,0 +1,4 @@
+-- scope: shard
+DROP TABLE IF EXISTS `daily_revenue_rollups`;
+DROP TABLE IF EXISTS `daily_delivery_rollups`;
+DROP TABLE IF EXISTS `daily_booking_rollups`;
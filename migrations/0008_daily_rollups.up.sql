@@ -0,0 +1,34 @@
+-- scope: shard
+-- Daily analytics rollups, maintained incrementally by the booking,
+-- status-update and invoice-payment write paths (see rollups.py).
+-- Lane = origin_city -> destination_city ('' when unknown).
+CREATE TABLE IF NOT EXISTS `daily_booking_rollups` (
+  `day` date NOT NULL,
+  `status` varchar(20) NOT NULL,
+  `service_type` varchar(20) NOT NULL DEFAULT '',
+  `origin_city` varchar(100) NOT NULL DEFAULT '',
+  `destination_city` varchar(100) NOT NULL DEFAULT '',
+  `bookings` int(11) NOT NULL DEFAULT 0,
+  `booked_amount` decimal(14,2) NOT NULL DEFAULT 0.00,
+  PRIMARY KEY (`day`, `status`, `service_type`, `origin_city`, `destination_city`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE IF NOT EXISTS `daily_delivery_rollups` (
+  `day` date NOT NULL,
+  `service_type` varchar(20) NOT NULL DEFAULT '',
+  `origin_city` varchar(100) NOT NULL DEFAULT '',
+  `destination_city` varchar(100) NOT NULL DEFAULT '',
+  `delivered` int(11) NOT NULL DEFAULT 0,
+  `on_time` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`day`, `service_type`, `origin_city`, `destination_city`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE IF NOT EXISTS `daily_revenue_rollups` (
+  `day` date NOT NULL,
+  `service_type` varchar(20) NOT NULL DEFAULT '',
+  `origin_city` varchar(100) NOT NULL DEFAULT '',
+  `destination_city` varchar(100) NOT NULL DEFAULT '',
+  `invoices_paid` int(11) NOT NULL DEFAULT 0,
+  `revenue` decimal(14,2) NOT NULL DEFAULT 0.00,
+  PRIMARY KEY (`day`, `service_type`, `origin_city`, `destination_city`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
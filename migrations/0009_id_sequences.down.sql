@@ -0,0 +1,2 @@
+-- scope: primary
+DROP TABLE IF EXISTS `id_sequences`;
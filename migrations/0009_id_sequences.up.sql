@@ -0,0 +1,12 @@
+-- scope: primary
+-- Block-allocated counters (onboarding.allocate_codes). last_value is
+-- bumped atomically with LAST_INSERT_ID(), so codes never collide.
+CREATE TABLE IF NOT EXISTS `id_sequences` (
+  `name` varchar(50) NOT NULL,
+  `last_value` bigint(20) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+INSERT IGNORE INTO `id_sequences` (`name`, `last_value`)
+SELECT 'employee_code', COALESCE(MAX(CAST(SUBSTRING(`employee_code`, 4) AS UNSIGNED)), 0)
+FROM `employees`;
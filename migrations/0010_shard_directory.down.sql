@@ -0,0 +1,3 @@
+-- scope: primary
+DROP TABLE IF EXISTS `relocated_bookings`;
+DROP TABLE IF EXISTS `customer_shards`;
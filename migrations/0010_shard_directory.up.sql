@@ -0,0 +1,22 @@
+-- scope: primary
+-- Shard directory (sharding.ShardDirectory). customer_shards places each
+-- customer registered while SHARDS is set; customers without a row predate
+-- sharding and live on shard 0. relocated_bookings lists bookings moved by
+-- 'flask move-customer' off the shard their id / tracking id names.
+CREATE TABLE IF NOT EXISTS `customer_shards` (
+  `customer_id` int(11) NOT NULL,
+  `shard` smallint(6) NOT NULL,
+  PRIMARY KEY (`customer_id`),
+  KEY `idx_customer_shards_shard` (`shard`),
+  CONSTRAINT `customer_shards_ibfk_1` FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE IF NOT EXISTS `relocated_bookings` (
+  `booking_id` bigint(20) NOT NULL,
+  `tracking_id` varchar(20) NOT NULL,
+  `customer_id` int(11) NOT NULL,
+  `shard` smallint(6) NOT NULL,
+  PRIMARY KEY (`booking_id`),
+  UNIQUE KEY `idx_relocated_tracking` (`tracking_id`),
+  KEY `idx_relocated_customer` (`customer_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
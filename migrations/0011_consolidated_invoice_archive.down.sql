@@ -0,0 +1,3 @@
+-- scope: shard
+DROP TABLE IF EXISTS `consolidated_invoice_items_archive`;
+DROP TABLE IF EXISTS `consolidated_invoices_archive`;
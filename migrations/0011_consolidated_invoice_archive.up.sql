@@ -0,0 +1,14 @@
+-- scope: shard
+-- Archive tables for consolidated invoices (archive.py). Links move with
+-- their archived invoices; a header moves once it is settled and all its
+-- invoices are archived. No foreign keys: an archived link's header may
+-- still be live.
+CREATE TABLE IF NOT EXISTS `consolidated_invoices_archive` LIKE `consolidated_invoices`;
+ALTER TABLE `consolidated_invoices_archive` ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8;
+
+CREATE TABLE IF NOT EXISTS `consolidated_invoice_items_archive` (
+  `invoice_id` int(11) NOT NULL,
+  `consolidated_invoice_id` int(11) NOT NULL,
+  PRIMARY KEY (`invoice_id`),
+  KEY `consolidated_invoice_id` (`consolidated_invoice_id`)
+) ENGINE=InnoDB ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8 DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
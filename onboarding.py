@@ -0,0 +1,191 @@
+import csv
+import io
+import multiprocessing
+import os
+import random
+import string
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+# ---------- BULK EMPLOYEE ONBOARDING ----------
+# CSV columns: name,email,phone,address,department,role,employment_type,join_date,location,photo
+# "photo" names a file inside the optional photo ZIP. Password hashing and
+# photo resizing are CPU bound, so both run in a process pool before any
+# lock is taken; the employee_code sequence row is locked only for the
+# short transaction that inserts the rows. Photos are written to temporary
+# files and moved into place after the commit, so a failed batch leaves no
+# files behind. The pool uses the forkserver start method: the web workers
+# run threads, and forking a threaded process can copy a held lock into the
+# child.
+
+CSV_COLUMNS = ("name", "email", "phone", "address", "department", "role",
+               "employment_type", "join_date", "location", "photo")
+PHOTO_SIZE = (512, 512)
+PHOTO_QUALITY = 80
+# cells starting with these are evaluated as formulas by spreadsheet apps
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def random_password(length=10):
+    return "".join(random.choices(string.ascii_letters + string.digits, k=length))
+
+
+def allocate_codes(cursor, count, name="employee_code"):
+    # reserves a block of `count` numbers; the row lock is held until commit
+    cursor.execute(
+        "UPDATE id_sequences SET last_value = LAST_INSERT_ID(last_value + %s) WHERE name=%s",
+        (count, name)
+    )
+    if cursor.rowcount == 0:
+        raise RuntimeError(f"Sequence {name} missing, run 'flask db-migrate'.")
+    cursor.execute("SELECT LAST_INSERT_ID()")
+    last = cursor.fetchone()[0]
+    return [f"EMP{n:03d}" for n in range(last - count + 1, last + 1)]
+
+
+def parse_employees_csv(data):
+    reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+    missing = {"name", "email", "department", "role", "join_date"} - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+    rows = []
+    for line_no, row in enumerate(reader, start=2):
+        row = {col: (row.get(col) or "").strip() for col in CSV_COLUMNS}
+        if not row["name"] or not row["email"]:
+            raise ValueError(f"Line {line_no}: name and email are required")
+        row["department"] = row["department"].lower()
+        row["employment_type"] = row["employment_type"] or "Full-time"
+        rows.append(row)
+    return rows
+
+
+def _require_pillow():
+    try:
+        import PIL  # noqa: F401  (Pillow is only needed when photos are uploaded)
+    except ImportError:
+        raise RuntimeError("Pillow is required to process employee photos.") from None
+
+
+def _resize(data):
+    # runs in a worker process; returns the photo as jpeg bytes
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert("RGB")
+        img.thumbnail(PHOTO_SIZE)
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=PHOTO_QUALITY, optimize=True)
+    return buf.getvalue()
+
+
+def resize_photo(data):
+    # single upload (admin registration form): resized in the request thread
+    _require_pillow()
+    return _resize(data)
+
+
+def resize_photos(pool, keys_to_bytes, upload_folder):
+    # -> {key: temporary file in upload_folder}; publish_photos() moves them
+    if not keys_to_bytes:
+        return {}
+    _require_pillow()
+    os.makedirs(upload_folder, exist_ok=True)
+
+    keys = list(keys_to_bytes)
+    tmp_paths = {}
+    try:
+        for key, photo in zip(keys, pool.map(_resize, [keys_to_bytes[k] for k in keys])):
+            fd, tmp_paths[key] = tempfile.mkstemp(dir=upload_folder, prefix=".onboarding.", suffix=".jpg")
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(photo)
+    except BaseException:
+        discard_photos(tmp_paths)
+        raise
+    return tmp_paths
+
+
+def publish_photos(tmp_paths, filenames, upload_folder):
+    for key, tmp_path in tmp_paths.items():
+        os.replace(tmp_path, os.path.join(upload_folder, filenames[key]))
+
+
+def discard_photos(tmp_paths):
+    for tmp_path in tmp_paths.values():
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def onboard_employees(conn, csv_data, photos_zip=None, upload_folder="static/uploads/employees", workers=None):
+    rows = parse_employees_csv(csv_data)
+    if not rows:
+        return []
+
+    photo_bytes = {}
+    if photos_zip:
+        with zipfile.ZipFile(io.BytesIO(photos_zip)) as zf:
+            names = {os.path.basename(n): n for n in zf.namelist() if not n.endswith("/")}
+            for row in rows:
+                if row["photo"]:
+                    if row["photo"] not in names:
+                        raise ValueError(f"Photo {row['photo']} not found in ZIP")
+                    photo_bytes[row["email"]] = zf.read(names[row["photo"]])
+
+    # CPU-bound work first, outside the transaction
+    passwords = [random_password() for _ in rows]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver")) as pool:
+        hashes = list(pool.map(generate_password_hash, passwords, chunksize=max(1, len(rows) // 32)))
+        tmp_photos = resize_photos(pool, photo_bytes, upload_folder)
+
+    cursor = conn.cursor()
+    try:
+        codes = allocate_codes(cursor, len(rows))
+        photos = {r["email"]: f"{code}.jpg" for code, r in zip(codes, rows) if r["email"] in tmp_photos}
+        cursor.executemany(
+            "INSERT INTO users (fullname, username, email, password_hash, role, status) VALUES (%s,%s,%s,%s,%s,%s)",
+            [(r["name"], r["name"], r["email"], h, "employee", "active") for r, h in zip(rows, hashes)]
+        )
+        placeholders = ",".join(["%s"] * len(rows))
+        cursor.execute(f"SELECT id, email FROM users WHERE email IN ({placeholders})",
+                       [r["email"] for r in rows])
+        user_ids = {email: user_id for user_id, email in cursor.fetchall()}
+
+        cursor.executemany(
+            """
+            INSERT INTO employees
+            (user_id, employee_code, phone_number, address, department, position, employment_type, hire_date, location, photo)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+            """,
+            [(user_ids[r["email"]], code, r["phone"] or None, r["address"] or None, r["department"],
+              r["role"], r["employment_type"], r["join_date"], r["location"] or None, photos.get(r["email"]))
+             for code, r in zip(codes, rows)]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        discard_photos(tmp_photos)
+        raise
+    finally:
+        cursor.close()
+
+    publish_photos(tmp_photos, photos, upload_folder)
+    return [(code, r["name"], r["email"], pw) for code, r, pw in zip(codes, rows, passwords)]
+
+
+def _csv_safe(value):
+    value = "" if value is None else str(value)
+    return "'" + value if value.startswith(FORMULA_PREFIXES) else value
+
+
+def credentials_csv(created):
+    # rows from onboard_employees(); names and emails come from the upload,
+    # so cells that a spreadsheet would run as a formula are quoted
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(("employee_code", "name", "email", "temporary_password"))
+    writer.writerows([_csv_safe(v) for v in row] for row in created)
+    return buf.getvalue()
@@ -0,0 +1,215 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+# ---------- SAMPLING PROFILER ----------
+# Admins switch profiling on for chosen endpoints and/or a random share of
+# all requests. A profiled request gets a helper thread that samples the
+# request thread's stack every `interval` seconds; stacks are labelled
+# module:function, so time in mysql.connector, jinja2 and reportlab shows up
+# directly. Finished profiles are written to `directory` (shared by all
+# workers) and exported as collapsed stacks (flamegraph.pl, speedscope,
+# inferno) or speedscope JSON.
+#
+# Settings live in a JSON file in the same directory so every worker sees
+# them. While profiling is off a request only compares a timestamp; the
+# settings file is stat()ed at most every SETTINGS_CHECK_INTERVAL seconds.
+# Sampling needs real threads, so use the gthread worker when profiling.
+
+SETTINGS_FILE = "settings.json"
+SETTINGS_CHECK_INTERVAL = 2.0
+PROFILE_NAME = re.compile(r"^[\w.-]+\.json$")
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval, max_seconds):
+        super().__init__(daemon=True, name="profiler-sampler")
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = {}
+        self.samples = 0
+        self.started = time.time()
+        self.duration = 0.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop_event.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+                frame = frame.f_back
+            key = ";".join(reversed(names))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.duration = time.time() - self.started
+
+
+class Profiler:
+    def __init__(self, directory, interval=0.005, max_seconds=120, keep=50):
+        self.directory = directory
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.keep = keep
+        self.enabled = False
+        self.endpoints = set()
+        self.sample_rate = 0.0
+        self._settings_mtime = None
+        self._settings_checked = 0.0
+
+    # --- settings ---
+    def configure(self, endpoints, sample_rate):
+        os.makedirs(self.directory, exist_ok=True)
+        settings = {"endpoints": sorted(endpoints), "sample_rate": max(0.0, min(float(sample_rate), 1.0))}
+        tmp_path = os.path.join(self.directory, f".{SETTINGS_FILE}.{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(settings, fh)
+        os.replace(tmp_path, os.path.join(self.directory, SETTINGS_FILE))
+        self._settings_checked = 0.0
+        self.refresh()
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._settings_checked < SETTINGS_CHECK_INTERVAL:
+            return
+        self._settings_checked = now
+        path = os.path.join(self.directory, SETTINGS_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._settings_mtime:
+            return
+        self._settings_mtime = mtime
+        settings = {}
+        if mtime is not None:
+            try:
+                with open(path, encoding="utf-8") as fh:
+                    settings = json.load(fh)
+            except (OSError, ValueError):
+                settings = {}
+        self.endpoints = set(settings.get("endpoints", []))
+        self.sample_rate = float(settings.get("sample_rate", 0.0))
+        self.enabled = bool(self.endpoints) or self.sample_rate > 0
+
+    def should_profile(self, endpoint):
+        self.refresh()
+        if not self.enabled or endpoint is None or endpoint == "static":
+            return False
+        return endpoint in self.endpoints or random.random() < self.sample_rate
+
+    # --- recording ---
+    def start(self):
+        sampler = Sampler(threading.get_ident(), self.interval, self.max_seconds)
+        sampler.start()
+        return sampler
+
+    def finish(self, sampler, endpoint, path, status=None):
+        sampler.stop()
+        if not sampler.samples:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        name = "{}-{}-{}.json".format(
+            time.strftime("%Y%m%d-%H%M%S", time.localtime(sampler.started)),
+            re.sub(r"[^\w]+", "_", endpoint or "unknown"),
+            f"{os.getpid()}-{sampler.ident}",
+        )
+        profile = {
+            "endpoint": endpoint,
+            "path": path,
+            "status": status,
+            "started": sampler.started,
+            "duration": sampler.duration,
+            "interval": sampler.interval,
+            "samples": sampler.samples,
+            "stacks": sampler.stacks,
+        }
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as fh:
+            json.dump(profile, fh)
+        self._prune()
+        return name
+
+    def _prune(self):
+        names = sorted(self._profile_names(), reverse=True)
+        for name in names[self.keep:]:
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    # --- reading ---
+    def _profile_names(self):
+        try:
+            return [name for name in os.listdir(self.directory)
+                    if PROFILE_NAME.match(name) and name != SETTINGS_FILE]
+        except OSError:
+            return []
+
+    def list_profiles(self):
+        profiles = []
+        for name in sorted(self._profile_names(), reverse=True):
+            profile = self.load(name)
+            if profile:
+                profile["name"] = name
+                profile.pop("stacks", None)
+                profile["started"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(profile["started"]))
+                profiles.append(profile)
+        return profiles
+
+    def load(self, name):
+        if not PROFILE_NAME.match(name) or name == SETTINGS_FILE:
+            return None
+        try:
+            with open(os.path.join(self.directory, name), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+
+def collapsed_stacks(profile):
+    # one "frame;frame;frame count" line per distinct stack (Brendan Gregg format)
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(profile["stacks"].items()))
+
+
+def speedscope(profile, name):
+    frames = []
+    index = {}
+    samples = []
+    weights = []
+    for stack, count in profile["stacks"].items():
+        ids = []
+        for frame in stack.split(";"):
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame})
+            ids.append(index[frame])
+        samples.append(ids)
+        weights.append(count * profile["interval"])
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "cargopro-profiler",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": f"{profile['endpoint']} {profile['path']}",
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
@@ -0,0 +1,151 @@
+from collections import namedtuple
+
+from mysql.connector import Error, pooling
+
+# ---------- DATA ACCESS ----------
+# Named queries that select only the columns the templates use and run as
+# server-side prepared statements. Rows come back as namedtuples, which are
+# slotted and much smaller than the dicts returned by cursor(dictionary=True).
+# The prepared cursors are cached on the connection, not the Repository, so
+# with a StatementPool a statement is prepared once per pooled connection
+# and reused by every later request that borrows it.
+
+CustomerShipment = namedtuple(
+    "CustomerShipment", "id tracking_id destination_city booking_date status"
+)
+BookingSummary = namedtuple(
+    "BookingSummary", "id tracking_id origin_city destination_city status booking_date"
+)
+TrackingEvent = namedtuple("TrackingEvent", "status location notes updated_at")
+
+# name -> (row type, sql); a row type of None returns plain tuples
+QUERIES = {
+    "customer_id_for_user": (None, """
+        SELECT id FROM customers WHERE user_id=%s
+    """),
+    "user_status": (None, """
+        SELECT status FROM users WHERE id=%s
+    """),
+    "user_id_for_employee_code": (None, """
+        SELECT user_id FROM employees WHERE employee_code=%s
+    """),
+    "customer_shipments": (CustomerShipment, """
+        SELECT id, tracking_id, destination_city, booking_date, status
+        FROM cargo_bookings
+        WHERE customer_id=%s ORDER BY booking_date DESC
+    """),
+    "recent_bookings": (BookingSummary, """
+        SELECT id, tracking_id, origin_city, destination_city, status, booking_date
+        FROM cargo_bookings ORDER BY booking_date DESC LIMIT 50
+    """),
+    "booking_summary": (BookingSummary, """
+        SELECT id, tracking_id, origin_city, destination_city, status, booking_date
+        FROM cargo_bookings WHERE id=%s
+    """),
+    "booking_id_by_tracking_id": (None, """
+        SELECT id FROM cargo_bookings WHERE tracking_id=%s
+    """),
+    "tracking_id_by_booking_id": (None, """
+        SELECT tracking_id FROM cargo_bookings WHERE id=%s
+    """),
+    "tracking_events": (TrackingEvent, """
+        SELECT status, location, notes, updated_at
+        FROM tracking_updates WHERE booking_id=%s ORDER BY updated_at DESC
+    """),
+    # read-only views of shipments moved to the archive tables (archive.py)
+    "archived_booking_summary": (BookingSummary, """
+        SELECT id, tracking_id, origin_city, destination_city, status, booking_date
+        FROM cargo_bookings_archive WHERE id=%s
+    """),
+    "archived_booking_id_by_tracking_id": (None, """
+        SELECT id FROM cargo_bookings_archive WHERE tracking_id=%s
+    """),
+    "archived_tracking_events": (TrackingEvent, """
+        SELECT status, location, notes, updated_at
+        FROM tracking_updates_archive WHERE booking_id=%s ORDER BY updated_at DESC
+    """),
+    "update_booking_status": (None, """
+        UPDATE cargo_bookings SET status=%s WHERE id=%s
+    """),
+    "insert_tracking_event": (None, """
+        INSERT INTO tracking_updates (booking_id, location, status, notes) VALUES (%s,%s,%s,%s)
+    """),
+}
+
+
+class StatementPool(pooling.MySQLConnectionPool):
+    # The stock pool resets the session when a connection is returned, which
+    # deallocates its prepared statements. This pool keeps the session and
+    # only rolls back, so no transaction or read snapshot outlives the
+    # request that opened it.
+    def __init__(self, **kwargs):
+        super().__init__(pool_reset_session=False, **kwargs)
+
+    def add_connection(self, cnx=None):
+        if cnx is not None:
+            try:
+                cnx.rollback()
+            except Error:
+                cnx.disconnect()  # reconnected (with a fresh session) on next use
+        super().add_connection(cnx)
+
+
+def _statement_cursors(conn):
+    # -> {query name: prepared cursor} for the session behind conn
+    cnx = getattr(conn, "_cnx", conn)  # a PooledMySQLConnection wraps the real one
+    cached = getattr(cnx, "_statement_cursors", None)
+    if cached is None or cached[0] != cnx.connection_id:
+        # new connection, or the pool reconnected it and the statements are gone
+        cached = cnx._statement_cursors = (cnx.connection_id, {})
+    return cached[1]
+
+
+class Repository:
+    def __init__(self, conn, owns_connection=True):
+        self.conn = conn
+        self.owns_connection = owns_connection
+        # one prepared cursor per named query, kept with the connection
+        self._cursors = _statement_cursors(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _execute(self, name, params):
+        cursor = self._cursors.get(name)
+        if cursor is None:
+            cursor = self._cursors[name] = self.conn.cursor(prepared=True)
+        cursor.execute(QUERIES[name][1], params)
+        return cursor
+
+    def fetch_all(self, name, params=()):
+        row_type = QUERIES[name][0]
+        rows = self._execute(name, params).fetchall()
+        return [row_type._make(row) for row in rows] if row_type else rows
+
+    def fetch_one(self, name, params=()):
+        row_type = QUERIES[name][0]
+        cursor = self._execute(name, params)
+        row = cursor.fetchone()
+        # drain any remaining rows so the cursor can be reused
+        cursor.fetchall()
+        if row is None:
+            return None
+        return row_type._make(row) if row_type else row
+
+    def execute(self, name, params=()):
+        return self._execute(name, params).rowcount
+
+    def insert(self, name, params=()):
+        return self._execute(name, params).lastrowid
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        # the cursors stay open for the next request on this connection;
+        # an unpooled connection takes its statements with it when closed
+        if self.owns_connection:
+            self.conn.close()
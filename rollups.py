@@ -0,0 +1,236 @@
+from datetime import date
+
+# ---------- ANALYTICS ROLLUPS ----------
+# Write paths call these inside their own transaction so the rollup rows
+# always agree with cargo_bookings / invoices. The analytics page reads only
+# the rollup tables (migrations/0008_daily_rollups).
+#
+# A delivery is counted on its booking's actual_delivery_date, which
+# record_status_change sets, and uncounted again if the booking leaves
+# "delivered", so the incremental rows match what backfill() rebuilds.
+
+LANE_COLUMNS = """
+    COALESCE(b.service_type, ''), COALESCE(b.origin_city, ''), COALESCE(b.destination_city, '')
+"""
+DELIVERY_DAY = "COALESCE(b.actual_delivery_date, DATE(b.updated_at))"
+
+# cargo_bookings.status; tracking_updates.status also has the two
+# milestones below, which leave the booking in transit
+BOOKING_STATUSES = ("pending", "confirmed", "in_transit", "delivered", "cancelled")
+TRACKING_MILESTONES = {"dispatched": "in_transit", "arrived": "in_transit"}
+TRACKING_STATUSES = BOOKING_STATUSES + tuple(TRACKING_MILESTONES)
+
+
+def booking_status_for(tracking_status):
+    # booking status implied by a tracking update; ValueError for unknown values
+    status = TRACKING_MILESTONES.get(tracking_status, tracking_status)
+    if status not in BOOKING_STATUSES:
+        raise ValueError(f"Unknown status {tracking_status!r}")
+    return status
+
+
+def _add_booking(cursor, key, bookings, amount):
+    cursor.execute("""
+        INSERT INTO daily_booking_rollups
+            (day, status, service_type, origin_city, destination_city, bookings, booked_amount)
+        VALUES (%s,%s,%s,%s,%s,%s,%s)
+        ON DUPLICATE KEY UPDATE bookings = bookings + VALUES(bookings),
+                                booked_amount = booked_amount + VALUES(booked_amount)
+    """, (*key, bookings, amount))
+
+
+def _booking_facts(cursor, booking_id):
+    # locks the booking row so concurrent status changes are applied in order
+    cursor.execute(f"""
+        SELECT DATE(b.booking_date), COALESCE(b.status, ''), {LANE_COLUMNS},
+               COALESCE(b.total_amount, 0), b.expected_delivery_date, {DELIVERY_DAY}
+        FROM cargo_bookings b WHERE b.id=%s FOR UPDATE
+    """, (booking_id,))
+    return cursor.fetchone()
+
+
+def record_new_booking(conn, booking_id):
+    cursor = conn.cursor()
+    try:
+        facts = _booking_facts(cursor, booking_id)
+        if facts:
+            day, status, service_type, origin, destination, amount, _, _ = facts
+            _add_booking(cursor, (day, status, service_type, origin, destination), 1, amount)
+    finally:
+        cursor.close()
+
+
+def _add_delivery(cursor, day, lane, expected, delivered):
+    # delivered is +1 or -1; on time means delivered on or before the expected date
+    on_time = delivered if expected is None or day <= expected else 0
+    cursor.execute("""
+        INSERT INTO daily_delivery_rollups
+            (day, service_type, origin_city, destination_city, delivered, on_time)
+        VALUES (%s,%s,%s,%s,%s,%s)
+        ON DUPLICATE KEY UPDATE delivered = delivered + VALUES(delivered),
+                                on_time = on_time + VALUES(on_time)
+    """, (day, *lane, delivered, on_time))
+
+
+def record_status_change(conn, booking_id, new_status):
+    # call before cargo_bookings.status is updated
+    if new_status not in BOOKING_STATUSES:
+        raise ValueError(f"Unknown booking status {new_status!r}")
+    cursor = conn.cursor()
+    try:
+        facts = _booking_facts(cursor, booking_id)
+        if not facts or facts[1] == new_status:
+            return
+        day, old_status, service_type, origin, destination, amount, expected, delivered_on = facts
+        lane = (service_type, origin, destination)
+        _add_booking(cursor, (day, old_status, *lane), -1, -amount)
+        _add_booking(cursor, (day, new_status, *lane), 1, amount)
+
+        if old_status == "delivered":
+            _add_delivery(cursor, delivered_on, lane, expected, -1)
+        if new_status == "delivered":
+            today = date.today()
+            cursor.execute("UPDATE cargo_bookings SET actual_delivery_date=%s WHERE id=%s", (today, booking_id))
+            _add_delivery(cursor, today, lane, expected, 1)
+    finally:
+        cursor.close()
+
+
+def record_invoice_payment(conn, invoice_id, invoices_table="invoices", bookings_table="cargo_bookings"):
+    # the *_archive pair is passed when the paid invoice's shipment is archived
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            INSERT INTO daily_revenue_rollups
+                (day, service_type, origin_city, destination_city, invoices_paid, revenue)
+            SELECT DATE(i.paid_at), {LANE_COLUMNS}, 1, i.amount
+            FROM {invoices_table} i JOIN {bookings_table} b ON i.booking_id = b.id
+            WHERE i.id=%s AND i.paid_at IS NOT NULL
+            ON DUPLICATE KEY UPDATE invoices_paid = invoices_paid + 1,
+                                    revenue = revenue + VALUES(revenue)
+        """, (invoice_id,))
+    finally:
+        cursor.close()
+
+
+BOOKING_COLUMNS = ("booking_date", "status", "service_type", "origin_city", "destination_city",
+                   "total_amount", "expected_delivery_date", "actual_delivery_date", "updated_at")
+
+
+def _live_and_archived(table, columns):
+    # derived table over a live table and its *_archive twin
+    cols = ", ".join(columns)
+    return f"(SELECT {cols} FROM {table} UNION ALL SELECT {cols} FROM {table}_archive)"
+
+
+def backfill(conn):
+    # rebuild all rollups from the live and archived base tables in one transaction
+    bookings = _live_and_archived("cargo_bookings", BOOKING_COLUMNS)
+    cursor = conn.cursor()
+    try:
+        for table in ("daily_booking_rollups", "daily_delivery_rollups", "daily_revenue_rollups"):
+            cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"""
+            INSERT INTO daily_booking_rollups
+                (day, status, service_type, origin_city, destination_city, bookings, booked_amount)
+            SELECT DATE(b.booking_date), COALESCE(b.status, ''), {LANE_COLUMNS},
+                   COUNT(*), COALESCE(SUM(b.total_amount), 0)
+            FROM {bookings} b
+            GROUP BY 1, 2, 3, 4, 5
+        """)
+        # actual_delivery_date is used when recorded, otherwise the last update
+        cursor.execute(f"""
+            INSERT INTO daily_delivery_rollups
+                (day, service_type, origin_city, destination_city, delivered, on_time)
+            SELECT {DELIVERY_DAY}, {LANE_COLUMNS},
+                   COUNT(*),
+                   SUM(b.expected_delivery_date IS NULL OR {DELIVERY_DAY} <= b.expected_delivery_date)
+            FROM {bookings} b
+            WHERE b.status = 'delivered'
+            GROUP BY 1, 2, 3, 4
+        """)
+        # an invoice is archived together with its booking
+        paid = """
+            SELECT DATE(i.paid_at) AS day, COALESCE(b.service_type, '') AS service_type,
+                   COALESCE(b.origin_city, '') AS origin_city,
+                   COALESCE(b.destination_city, '') AS destination_city, i.amount
+            FROM {invoices} i JOIN {bookings} b ON i.booking_id = b.id
+            WHERE i.status = 'paid' AND i.paid_at IS NOT NULL
+        """
+        cursor.execute(f"""
+            INSERT INTO daily_revenue_rollups
+                (day, service_type, origin_city, destination_city, invoices_paid, revenue)
+            SELECT p.day, p.service_type, p.origin_city, p.destination_city, COUNT(*), SUM(p.amount)
+            FROM (
+                {paid.format(invoices="invoices", bookings="cargo_bookings")}
+                UNION ALL
+                {paid.format(invoices="invoices_archive", bookings="cargo_bookings_archive")}
+            ) p
+            GROUP BY 1, 2, 3, 4
+        """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def merge_dashboards(results):
+    # sums the per-shard load_dashboard() results
+    keys = (("day", "status"), ("day", "service_type"), ("service_type", "origin_city", "destination_city"))
+    sums = (("bookings",), ("invoices_paid", "revenue"), ("delivered", "on_time"))
+    merged = []
+    for part, (key_fields, sum_fields) in enumerate(zip(keys, sums)):
+        totals = {}
+        for result in results:
+            for row in result[part]:
+                key = tuple(row[f] for f in key_fields)
+                if key in totals:
+                    for f in sum_fields:
+                        totals[key][f] += row[f]
+                else:
+                    totals[key] = dict(row)
+        merged.append(list(totals.values()))
+    bookings_by_status, revenue, on_time = merged
+    bookings_by_status.sort(key=lambda r: r["status"])
+    bookings_by_status.sort(key=lambda r: r["day"], reverse=True)
+    revenue.sort(key=lambda r: r["service_type"])
+    revenue.sort(key=lambda r: r["day"], reverse=True)
+    on_time.sort(key=lambda r: r["delivered"], reverse=True)
+    return bookings_by_status, revenue, on_time
+
+
+def load_dashboard(conn, date_from, date_to):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT day, status, SUM(bookings) AS bookings
+            FROM daily_booking_rollups
+            WHERE day BETWEEN %s AND %s
+            GROUP BY day, status HAVING SUM(bookings) <> 0
+            ORDER BY day DESC, status
+        """, (date_from, date_to))
+        bookings_by_status = cursor.fetchall()
+
+        cursor.execute("""
+            SELECT day, service_type, SUM(invoices_paid) AS invoices_paid, SUM(revenue) AS revenue
+            FROM daily_revenue_rollups
+            WHERE day BETWEEN %s AND %s
+            GROUP BY day, service_type
+            ORDER BY day DESC, service_type
+        """, (date_from, date_to))
+        revenue = cursor.fetchall()
+
+        cursor.execute("""
+            SELECT service_type, origin_city, destination_city,
+                   SUM(delivered) AS delivered, SUM(on_time) AS on_time
+            FROM daily_delivery_rollups
+            WHERE day BETWEEN %s AND %s
+            GROUP BY service_type, origin_city, destination_city
+            ORDER BY delivered DESC
+        """, (date_from, date_to))
+        on_time = cursor.fetchall()
+    finally:
+        cursor.close()
+    return bookings_by_status, revenue, on_time
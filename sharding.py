@@ -0,0 +1,432 @@
+import heapq
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+from repository import StatementPool
+
+# ---------- SHARDING ----------
+# Optional. users / customers / employees stay in the primary database;
+# cargo_bookings, tracking_updates and invoices live on the shard recorded
+# for the customer in the primary's customer_shards directory. New customers
+# go to the shard with the fewest customers, customers from before sharding
+# stay on shard 0, so adding a shard never moves anyone. Each shard numbers
+# its rows from shard << SHARD_BITS, so a booking id names its shard, and
+# sharded tracking ids carry the shard as a base-36 prefix character.
+# 'flask move-customer' copies a customer to another shard and lists the
+# moved bookings in relocated_bookings, which routing checks first.
+# Configure with SHARDS='[{"host": ..., "port": ..., "database": ...}, ...]'.
+# Without it there is a single "shard": the primary database.
+#
+# The primary keeps a copy of every booking-side table and receives every
+# migration; 'flask init-shards' copies those tables to each shard and
+# marks the shard-scoped migrations as applied there, later ones are applied
+# per shard by 'flask db-migrate'.
+
+SHARD_BITS = 40
+TRACKING_ID_LENGTH = 8
+# in foreign-key order
+SHARDED_TABLES = (
+    "cargo_bookings", "tracking_updates", "invoices",
+    "cargo_bookings_archive", "tracking_updates_archive", "invoices_archive",
+    "consolidated_invoices", "consolidated_invoice_items",
+    "consolidated_invoices_archive", "consolidated_invoice_items_archive",
+    "daily_booking_rollups", "daily_delivery_rollups", "daily_revenue_rollups",
+)
+# columns that hold (or reference) a shard-offset id
+WIDE_ID_COLUMNS = ("id", "booking_id", "invoice_id", "consolidated_invoice_id")
+# foreign keys into the primary database cannot exist on a shard
+CROSS_DB_FOREIGN_KEY = re.compile(r"FOREIGN KEY \(`(customer_id|assigned_employee_id)`\)")
+
+
+def load_shard_configs(raw, defaults):
+    if not raw:
+        return [dict(defaults)]
+    return [{**defaults, **shard} for shard in json.loads(raw)]
+
+
+class ShardDirectory:
+    # customer -> shard placements and relocated bookings, read from the
+    # primary over one dedicated connection (so a lookup never competes with
+    # the request for a pooled one). Placements are cached per customer for
+    # `ttl` seconds; the relocation map only holds moved customers' bookings
+    # and is reloaded whole once it is older than `ttl`. 'flask
+    # move-customer' waits out the ttl before it removes a customer's rows
+    # from the old shard.
+
+    def __init__(self, primary_config, ttl=30.0, max_entries=100000):
+        self.primary_config = primary_config
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._customers = {}
+        self._by_booking = {}
+        self._by_tracking = {}
+        self._relocations_expire = 0.0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_lock = threading.Lock()
+
+    def _query(self, sql, params=()):
+        with self._conn_lock:
+            if self._conn is None:
+                self._conn = mysql.connector.connect(**self.primary_config)
+            try:
+                cursor = self._conn.cursor()
+                try:
+                    cursor.execute(sql, params)
+                    rows = cursor.fetchall()
+                finally:
+                    cursor.close()
+                self._conn.commit()  # the next lookup reads a fresh snapshot
+            except mysql.connector.Error:
+                self._conn = None  # reconnect on the next lookup
+                raise
+            return rows
+
+    def customer_shard(self, customer_id):
+        now = time.monotonic()
+        entry = self._customers.get(customer_id)
+        if entry and entry[1] > now:
+            return entry[0]
+        rows = self._query("SELECT shard FROM customer_shards WHERE customer_id=%s", (customer_id,))
+        # customers without a row were registered before sharding
+        shard = rows[0][0] if rows else 0
+        with self._lock:
+            if len(self._customers) >= self.max_entries:
+                self._customers.clear()
+            self._customers[customer_id] = (shard, now + self.ttl)
+        return shard
+
+    def _relocations(self):
+        now = time.monotonic()
+        if self._relocations_expire <= now:
+            rows = self._query("SELECT booking_id, tracking_id, shard FROM relocated_bookings")
+            with self._lock:
+                self._by_booking = {booking_id: shard for booking_id, _, shard in rows}
+                self._by_tracking = {tracking_id.upper(): shard for _, tracking_id, shard in rows}
+                self._relocations_expire = now + self.ttl
+        return self._by_booking, self._by_tracking
+
+    def relocated_booking(self, booking_id):
+        return self._relocations()[0].get(int(booking_id))
+
+    def relocated_tracking_id(self, tracking_id):
+        return self._relocations()[1].get(tracking_id.strip().upper())
+
+    def clear(self):
+        # also after fork(): the inherited connection is dropped, not closed
+        with self._lock:
+            self._customers.clear()
+            self._relocations_expire = 0.0
+        self._conn = None
+
+
+def place_customer(cursor, customer_id, shard_count):
+    # records a new customer on the shard with the fewest customers; runs in
+    # the registration transaction on the primary
+    cursor.execute("SELECT shard, COUNT(*) FROM customer_shards GROUP BY shard")
+    placed = dict(cursor.fetchall())
+    cursor.execute("SELECT COUNT(*) FROM customers WHERE id <> %s", (customer_id,))
+    unplaced = cursor.fetchone()[0] - sum(placed.values())  # registered before sharding: shard 0
+    loads = {shard: placed.get(shard, 0) for shard in range(shard_count)}
+    loads[0] += max(unplaced, 0)
+    shard = min(loads, key=lambda s: (loads[s], s))
+    cursor.execute("INSERT INTO customer_shards (customer_id, shard) VALUES (%s,%s)", (customer_id, shard))
+    return shard
+
+
+class ShardRouter:
+    def __init__(self, configs, pool_size=0, connect_single=None, primary_config=None, directory_ttl=30.0):
+        self.configs = configs
+        self.pool_size = pool_size
+        # used instead of our own pools when there is only one database
+        self.connect_single = connect_single
+        self.directory = ShardDirectory(primary_config, directory_ttl) if primary_config else None
+        self._pools = {}
+
+    @property
+    def count(self):
+        return len(self.configs)
+
+    @property
+    def enabled(self):
+        return self.count > 1
+
+    def connect(self, shard):
+        if not self.enabled and self.connect_single:
+            return self.connect_single()
+        if self.pool_size <= 0:
+            return mysql.connector.connect(**self.configs[shard])
+        pool = self._pools.get(shard)
+        if pool is None:
+            pool = self._pools[shard] = StatementPool(
+                pool_name=f"cargo_shard{shard}", pool_size=self.pool_size, **self.configs[shard]
+            )
+        return pool.get_connection()
+
+    def reset(self):
+        self._pools = {}
+        if self.directory:
+            self.directory.clear()
+
+    # --- routing ---
+    def for_customer(self, customer_id):
+        if not self.enabled or self.directory is None:
+            return 0
+        shard = self.directory.customer_shard(int(customer_id))
+        return shard if shard < self.count else 0
+
+    def for_booking_id(self, booking_id):
+        if not self.enabled:
+            return 0
+        shard = self.directory.relocated_booking(booking_id) if self.directory else None
+        if shard is None:
+            shard = int(booking_id) >> SHARD_BITS
+        return shard if shard < self.count else 0
+
+    def for_tracking_id(self, tracking_id):
+        if not self.enabled or not tracking_id:
+            return 0
+        shard = self.directory.relocated_tracking_id(tracking_id) if self.directory else None
+        if shard is not None:
+            return shard if shard < self.count else 0
+        # legacy (unprefixed) ids were all issued before sharding, on shard 0
+        if len(tracking_id) != TRACKING_ID_LENGTH + 1:
+            return 0
+        try:
+            shard = int(tracking_id[0], 36)
+        except ValueError:
+            return 0
+        return shard if shard < self.count else 0
+
+    def encode_tracking_id(self, shard, base_id):
+        if not self.enabled:
+            return base_id
+        return "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"[shard] + base_id
+
+    # --- scatter / gather ---
+    def scatter(self, fn):
+        # fn(conn) runs on every shard in parallel; results in shard order
+        def run(shard):
+            conn = self.connect(shard)
+            try:
+                return fn(conn)
+            finally:
+                conn.close()
+
+        if not self.enabled:
+            return [run(0)]
+        with ThreadPoolExecutor(max_workers=self.count) as executor:
+            return list(executor.map(run, range(self.count)))
+
+    def gather_rows(self, sql, params=(), sort_key=None, reverse=False, limit=None):
+        # each shard's rows must already be sorted by sort_key (ORDER BY in sql)
+        def fetch(conn):
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+        results = self.scatter(fetch)
+        if sort_key is None:
+            rows = [row for shard_rows in results for row in shard_rows]
+        else:
+            rows = list(heapq.merge(*results, key=sort_key, reverse=reverse))
+        return rows[:limit] if limit is not None else rows
+
+    def gather_count(self, sql, params=()):
+        def count(conn):
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, params)
+                return cursor.fetchone()[0]
+            finally:
+                cursor.close()
+
+        return sum(self.scatter(count))
+
+
+def strip_cross_db_foreign_keys(ddl):
+    lines = [line for line in ddl.splitlines() if not CROSS_DB_FOREIGN_KEY.search(line)]
+    return re.sub(r",\s*\n\)", "\n)", "\n".join(lines))
+
+
+def shard_table_ddl(create_sql, shard):
+    # primary's SHOW CREATE TABLE -> the same table for one shard
+    ddl = strip_cross_db_foreign_keys(create_sql)
+    for column in WIDE_ID_COLUMNS:
+        ddl = re.sub(rf"`{column}` int(\(\d+\))?", f"`{column}` bigint(20)", ddl)
+    ddl = re.sub(r"\s*AUTO_INCREMENT=\d+", "", ddl)
+    ddl = re.sub(r"^\s*CREATE TABLE(?! IF NOT EXISTS)", "CREATE TABLE IF NOT EXISTS", ddl, count=1)
+    return f"{ddl} AUTO_INCREMENT={(shard << SHARD_BITS) + 1}"
+
+
+def shard_statement(sql, shard):
+    # a migration statement as it has to run on a shard; other statements
+    # (ALTER TABLE, CREATE TABLE ... LIKE) run unchanged
+    if re.match(r"\s*CREATE TABLE\b", sql, re.I) and not re.search(r"\bLIKE\s+`", sql, re.I):
+        return shard_table_ddl(sql, shard)
+    return sql
+
+
+def is_initialised(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = 'cargo_bookings'
+        """)
+        return cursor.fetchone()[0] > 0
+    finally:
+        cursor.close()
+
+
+def init_shards(primary_conn, router):
+    # copies the primary's booking-side tables to every shard
+    cursor = primary_conn.cursor()
+    try:
+        create_statements = []
+        for table in SHARDED_TABLES:
+            cursor.execute(f"SHOW CREATE TABLE `{table}`")
+            create_statements.append(cursor.fetchone()[1])
+    finally:
+        cursor.close()
+
+    for shard in range(router.count):
+        conn = router.connect(shard)
+        shard_cursor = conn.cursor()
+        try:
+            for create_sql in create_statements:
+                shard_cursor.execute(shard_table_ddl(create_sql, shard))
+            conn.commit()
+        finally:
+            shard_cursor.close()
+            conn.close()
+
+
+# ---------- MOVING A CUSTOMER ----------
+# Rows keep their ids, so the target must be a higher-numbered shard than
+# the customer's current one: explicit ids above a table's AUTO_INCREMENT
+# counter would advance it into another shard's id range. Rollup rows stay
+# where they are; the analytics page sums all shards, so totals are
+# unchanged.
+# In foreign-key order; each condition selects the customer's rows.
+CUSTOMER_ROWS = (
+    ("cargo_bookings", "customer_id = %s"),
+    ("tracking_updates", "booking_id IN (SELECT id FROM cargo_bookings WHERE customer_id = %s)"),
+    ("invoices", "booking_id IN (SELECT id FROM cargo_bookings WHERE customer_id = %s)"),
+    ("consolidated_invoices", "customer_id = %s"),
+    ("consolidated_invoice_items",
+     "consolidated_invoice_id IN (SELECT id FROM consolidated_invoices WHERE customer_id = %s)"),
+    ("cargo_bookings_archive", "customer_id = %s"),
+    ("tracking_updates_archive", "booking_id IN (SELECT id FROM cargo_bookings_archive WHERE customer_id = %s)"),
+    ("invoices_archive", "booking_id IN (SELECT id FROM cargo_bookings_archive WHERE customer_id = %s)"),
+    ("consolidated_invoices_archive", "customer_id = %s"),
+    ("consolidated_invoice_items_archive",
+     "invoice_id IN (SELECT id FROM invoices_archive WHERE booking_id IN "
+     "(SELECT id FROM cargo_bookings_archive WHERE customer_id = %s))"),
+)
+MOVE_BATCH = 1000
+
+
+def _copy_customer_rows(source, target, customer_id):
+    # REPLACE so a second pass picks up rows changed since the first
+    source_cursor = source.cursor()
+    target_cursor = target.cursor()
+    try:
+        # without FK checks REPLACE does not cascade its delete to child rows
+        target_cursor.execute("SET FOREIGN_KEY_CHECKS=0")
+        for table, condition in CUSTOMER_ROWS:
+            source_cursor.execute(f"SELECT * FROM {table} WHERE {condition}", (customer_id,))
+            columns = ", ".join(f"`{name}`" for name in source_cursor.column_names)
+            placeholders = ", ".join(["%s"] * len(source_cursor.column_names))
+            while True:
+                rows = source_cursor.fetchmany(MOVE_BATCH)
+                if not rows:
+                    break
+                target_cursor.executemany(f"REPLACE INTO {table} ({columns}) VALUES ({placeholders})", rows)
+        target.commit()
+        source.commit()
+    finally:
+        target_cursor.execute("SET FOREIGN_KEY_CHECKS=1")
+        source_cursor.close()
+        target_cursor.close()
+
+
+def _record_relocations(primary, target, customer_id, shard):
+    target_cursor = target.cursor()
+    try:
+        target_cursor.execute("""
+            SELECT id, tracking_id FROM cargo_bookings WHERE customer_id = %s
+            UNION ALL
+            SELECT id, tracking_id FROM cargo_bookings_archive WHERE customer_id = %s
+        """, (customer_id, customer_id))
+        bookings = target_cursor.fetchall()
+        target.commit()
+    finally:
+        target_cursor.close()
+    cursor = primary.cursor()
+    try:
+        cursor.executemany("""
+            INSERT INTO relocated_bookings (booking_id, tracking_id, customer_id, shard)
+            VALUES (%s,%s,%s,%s)
+            ON DUPLICATE KEY UPDATE shard = VALUES(shard)
+        """, [(booking_id, tracking_id, customer_id, shard) for booking_id, tracking_id in bookings])
+        cursor.execute("""
+            INSERT INTO customer_shards (customer_id, shard) VALUES (%s,%s)
+            ON DUPLICATE KEY UPDATE shard = VALUES(shard)
+        """, (customer_id, shard))
+        primary.commit()
+    finally:
+        cursor.close()
+
+
+def _delete_customer_rows(source, customer_id):
+    cursor = source.cursor()
+    try:
+        for table, condition in reversed(CUSTOMER_ROWS):
+            cursor.execute(f"DELETE FROM {table} WHERE {condition}", (customer_id,))
+        source.commit()
+    except Exception:
+        source.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def move_customer(primary, router, customer_id, target_shard, settle_seconds, log=print):
+    # copy -> switch the directory -> wait for every worker to see it ->
+    # copy what was written meanwhile -> delete from the old shard
+    cursor = primary.cursor()
+    try:
+        cursor.execute("SELECT shard FROM customer_shards WHERE customer_id=%s", (customer_id,))
+        row = cursor.fetchone()
+        primary.commit()
+    finally:
+        cursor.close()
+    source_shard = row[0] if row else 0
+    if not source_shard < target_shard < router.count:
+        raise ValueError(f"Customer {customer_id} is on shard {source_shard}; "
+                         f"the target must be a higher shard below {router.count}")
+
+    source = router.connect(source_shard)
+    target = router.connect(target_shard)
+    try:
+        log(f"Copying customer {customer_id} from shard {source_shard} to {target_shard}")
+        _copy_customer_rows(source, target, customer_id)
+        _record_relocations(primary, target, customer_id, target_shard)
+        log(f"Directory switched, waiting {settle_seconds:.0f}s for workers to pick it up")
+        time.sleep(settle_seconds)
+        _copy_customer_rows(source, target, customer_id)
+        _record_relocations(primary, target, customer_id, target_shard)
+        _delete_customer_rows(source, customer_id)
+    finally:
+        source.close()
+        target.close()
+    log(f"Customer {customer_id} moved to shard {target_shard}")
@@ -0,0 +1,27 @@
+# ---------- SQL SCRIPTS ----------
+# Minimal splitter for our own .sql files and the phpMyAdmin dump: statements
+# end with ";" at end of line, "--" comment lines are dropped. Not a full SQL
+# parser (no DELIMITER blocks, no ";" at line end inside string literals).
+
+
+def sql_statements(text):
+    statement = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("--"):
+            continue
+        statement.append(line)
+        if stripped.endswith(";"):
+            sql = "\n".join(statement).strip().rstrip(";").strip()
+            statement = []
+            if sql:
+                yield sql
+    tail = "\n".join(statement).strip()
+    if tail:
+        yield tail
+
+
+def run_sql_file(cursor, path):
+    with open(path, encoding="utf-8") as fh:
+        for statement in sql_statements(fh.read()):
+            cursor.execute(statement)
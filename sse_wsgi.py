@@ -0,0 +1,12 @@
+# gevent must patch sockets, threads and queues before anything imports
+# them (mysql.connector, redis, app), otherwise subscribers block real threads
+from gevent import monkey
+
+monkey.patch_all()
+
+import os  # noqa: E402
+
+# this server exists to hold the live tracking feeds
+os.environ["TRACKING_FEED"] = "1"
+
+from app import app  # noqa: E402,F401
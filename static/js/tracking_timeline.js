@@ -0,0 +1,31 @@
+// Live tracking updates: prepends each event pushed for the shipment to
+// #timeline and updates #current-status. The page leaves out
+// data-events-url when the shipment no longer changes (archived).
+(function () {
+  const timeline = document.getElementById("timeline");
+  if (!timeline || !timeline.dataset.eventsUrl) {
+    return;
+  }
+  const source = new EventSource(timeline.dataset.eventsUrl);
+  source.addEventListener("tracking", function (e) {
+    const update = JSON.parse(e.data);
+    const li = document.createElement("li");
+    const strong = document.createElement("strong");
+    strong.textContent = update.status;
+    li.appendChild(strong);
+    for (const text of ["Location: " + (update.location || ""), update.notes || ""]) {
+      const p = document.createElement("p");
+      p.textContent = text;
+      li.appendChild(p);
+    }
+    const time = document.createElement("p");
+    time.className = "time";
+    time.textContent = update.updated_at;
+    li.appendChild(time);
+    timeline.prepend(li);
+    const status = document.getElementById("current-status");
+    if (status) {
+      status.textContent = update.status;
+    }
+  });
+})();
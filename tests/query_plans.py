@@ -0,0 +1,397 @@
+import ast
+import builtins
+import importlib
+import itertools
+import os
+import re
+from datetime import date
+
+import mysql.connector
+
+import archive
+import billing
+import migrate
+import rollups
+from repository import QUERIES
+from sqlscript import run_sql_file
+
+# ---------- QUERY PLAN CHECKS ----------
+# Collects every SQL statement the application runs: cursor.execute() and
+# the shard helpers in app.py and the modules below, plus
+# repository.QUERIES. f-strings are rendered with the module's own
+# constants, the values of enclosing loops over module tuples (so a live /
+# archive pair gives two statements) and SAMPLE_VALUES for runtime values.
+# A statement that cannot be rendered is reported as uncovered.
+#
+# test_query_plans.py then loads the dump and all migrations into a scratch
+# database, fills it with synthetic data at realistic cardinalities and runs
+# EXPLAIN on each statement. A statement fails when it
+#   * full-scans a large table,
+#   * filesorts more than SORT_ROW_BUDGET rows of a large table, or
+#   * examines more than ROW_BUDGET rows of any table.
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DUMP_FILE = os.path.join(BASE_DIR, "cargo_db (3).sql")
+
+MODULES = ("app", "archive", "billing", "labels", "onboarding", "rollups", "sharding", "tracking_filter")
+
+LARGE_TABLES = {"cargo_bookings", "tracking_updates", "invoices", "users", "customers",
+                "cargo_bookings_archive", "tracking_updates_archive", "invoices_archive"}
+ROW_BUDGET = 5000
+SORT_ROW_BUDGET = 500
+
+# (users, bookings) at scale 1; tracking updates = 4 per booking
+CARDINALITIES = {"users": 20000, "bookings": 100000}
+
+# Statements (or whole functions) expected to read whole tables, with the reason.
+ALLOWED_FULL_SCANS = {
+    "app.admin_dashboard#1": "dashboard count of all customers",
+    "app.admin_dashboard#2": "dashboard count of all employees",
+    "app.admin_dashboard#3": "dashboard count of all bookings",
+    "app.admin_manage_customers#1": "unpaginated customer list",
+    "app.admin_manage_employees#1": "unpaginated employee list",
+    "app.admin_manage_cargo#1": "unpaginated cargo list",
+    "app.admin_generate_reports#1": "report over the whole date range",
+    "archive.archive_shipments": "nightly archival job",
+    "billing.create_missing_invoices": "billing run walks all delivered bookings",
+    "billing.consolidate_month": "monthly billing job",
+    "rollups.backfill": "full rebuild of the rollups",
+    "sharding.place_customer": "signup-time count of customers per shard",
+    "tracking_filter._count_bookings": "sizing the filter on a full build",
+    "tracking_filter._add_rows": "full build reads every tracking id",
+}
+
+# Statements that cannot be rendered from source, with the reason.
+UNCHECKED = {
+    "sharding.init_shards": "replays the primary's SHOW CREATE TABLE output",
+}
+
+# Runtime values used in f-strings, by variable name; a list gives one
+# statement per value.
+SAMPLE_VALUES = {
+    "placeholders": "%s,%s",
+    "period_sql": ["", " AND COALESCE(b.actual_delivery_date, DATE(b.updated_at)) >= %s"
+                       " AND COALESCE(b.actual_delivery_date, DATE(b.updated_at)) < %s"],
+    "table": ["cargo_bookings", "cargo_bookings_archive"],
+}
+
+# plain INSERT ... VALUES has nothing to plan, INSERT ... SELECT does
+SQL_START = re.compile(r"^\s*(SELECT\s|UPDATE\s|DELETE\s|INSERT\s+(IGNORE\s+)?INTO\s[^;]*?\bSELECT\s)", re.I)
+
+# cursor.execute() plus the shard router's and directory's helpers
+SQL_CALLS = ("execute", "gather_rows", "gather_count", "_query")
+
+
+# ---------- collecting statements ----------
+class Unrenderable(Exception):
+    pass
+
+
+class _Renderer:
+    # renders an expression from one function to every SQL string it can take
+    def __init__(self, namespace, function):
+        self.namespace = namespace
+        self.assignments = {}
+        # parameters with a string default, e.g. invoices_table="invoices"
+        args = function.args.args
+        for arg, default in zip(args[len(args) - len(function.args.defaults):], function.args.defaults):
+            if isinstance(default, ast.Constant) and isinstance(default.value, str):
+                self.assignments[arg.arg] = default
+        for node in ast.walk(function):
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                # the first assignment, e.g. query = """SELECT ...""" before += filters
+                self.assignments.setdefault(node.targets[0].id, node.value)
+
+    def render(self, node, env, depth=0):
+        if depth > 20:
+            raise Unrenderable("too deeply nested")
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            return [node.value]
+        if isinstance(node, ast.JoinedStr):
+            parts = []
+            for value in node.values:
+                if isinstance(value, ast.FormattedValue):
+                    parts.append(self.render(value.value, env, depth + 1))
+                else:
+                    parts.append([value.value])
+            return ["".join(combo) for combo in itertools.product(*parts)]
+        if isinstance(node, ast.Name):
+            return self._name(node.id, env, depth)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+            left = self.render(node.left, env, depth + 1)
+            right = self.render(node.right, env, depth + 1)
+            return [a + b for a in left for b in right]
+        comp = self._joined_comprehension(node)
+        if comp is not None:
+            # " UNION ALL ".join(f"..." for a, b in MODULE_TUPLE)
+            items = [self.render(comp.elt, {**env, **binding}, depth + 1)[0]
+                     for binding in self.loop_bindings(comp.generators[0], env)]
+            return [node.func.value.value.join(items)]
+        return [str(self._eval(node, env, depth))]
+
+    def _joined_comprehension(self, node):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "join"
+                and isinstance(node.func.value, ast.Constant) and len(node.args) == 1):
+            return None
+        comp = node.args[0]
+        if isinstance(comp, ast.Name):
+            comp = self.assignments.get(comp.id)
+        if isinstance(comp, (ast.ListComp, ast.GeneratorExp)) and len(comp.generators) == 1:
+            return comp
+        return None
+
+    def _name(self, name, env, depth):
+        if name in env:
+            return [str(env[name])]
+        if name in SAMPLE_VALUES:
+            value = SAMPLE_VALUES[name]
+            return list(value) if isinstance(value, list) else [value]
+        if name in self.assignments:
+            return self.render(self.assignments[name], env, depth + 1)
+        if isinstance(self.namespace.get(name), str):
+            return [self.namespace[name]]
+        raise Unrenderable(f"unknown value {name!r}")
+
+    def _eval(self, node, env, depth):
+        local = dict(env)
+        for sub in ast.walk(node):
+            if (isinstance(sub, ast.Name) and isinstance(sub.ctx, ast.Load)
+                    and sub.id not in local and sub.id not in self.namespace
+                    and not hasattr(builtins, sub.id)):
+                local[sub.id] = self._name(sub.id, env, depth + 1)[0]
+        try:
+            return eval(compile(ast.Expression(node), "<sql>", "eval"), self.namespace, local)
+        except Exception as e:
+            raise Unrenderable(f"cannot evaluate {ast.unparse(node)!r}: {e}")
+
+    def loop_bindings(self, loop, env):
+        # loop: ast.For or ast.comprehension over a constant / module tuple
+        try:
+            values = list(eval(compile(ast.Expression(loop.iter), "<sql>", "eval"), self.namespace, dict(env)))
+        except Exception:
+            return [{}]
+        bindings = []
+        for value in values:
+            if isinstance(loop.target, ast.Name):
+                bindings.append({loop.target.id: value})
+            elif isinstance(loop.target, ast.Tuple) and all(isinstance(t, ast.Name) for t in loop.target.elts):
+                bindings.append({t.id: v for t, v in zip(loop.target.elts, value)})
+            else:
+                return [{}]
+        return bindings or [{}]
+
+
+def _functions(tree):
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            yield node.name, node
+        elif isinstance(node, ast.ClassDef):
+            for item in node.body:
+                if isinstance(item, ast.FunctionDef):
+                    yield f"{node.name}.{item.name}", item
+
+
+def _sql_calls(node, loops=()):
+    # (call, enclosing for-loops) in source order
+    for child in ast.iter_child_nodes(node):
+        if (isinstance(child, ast.Call) and isinstance(child.func, ast.Attribute)
+                and child.func.attr in SQL_CALLS and child.args):
+            yield child, loops
+        inner = loops + (child,) if isinstance(child, ast.For) else loops
+        yield from _sql_calls(child, inner)
+
+
+def collect_module(module):
+    # -> ([(name, sql)], [(name, reason)]) for one application module
+    namespace = vars(importlib.import_module(module))
+    with open(os.path.join(BASE_DIR, f"{module}.py"), encoding="utf-8") as fh:
+        tree = ast.parse(fh.read())
+    statements, uncovered = [], []
+    for function_name, function in _functions(tree):
+        base = f"{module}.{function_name}"
+        params = {arg.arg for arg in function.args.args}
+        renderer = _Renderer(namespace, function)
+        calls = sorted(_sql_calls(function), key=lambda item: (item[0].lineno, item[0].col_offset))
+        for index, (call, loops) in enumerate(calls, start=1):
+            name = f"{base}#{index}"
+            arg = call.args[0]
+            if function.name in SQL_CALLS and isinstance(arg, ast.Name) and arg.id in params:
+                continue  # a helper passing its caller's SQL through
+            if base in UNCHECKED or name in UNCHECKED:
+                continue
+            try:
+                variants = []
+                for binding in itertools.product(*(renderer.loop_bindings(loop, {}) for loop in loops)):
+                    env = {k: v for part in binding for k, v in part.items()}
+                    variants.extend(renderer.render(arg, env))
+            except Unrenderable as e:
+                uncovered.append((name, f"line {call.lineno}: {e}"))
+                continue
+            variants = list(dict.fromkeys(sql for sql in variants if SQL_START.match(sql)))
+            if len(variants) == 1:
+                statements.append((name, variants[0]))
+            else:
+                statements.extend((f"{name}.{n}", sql) for n, sql in enumerate(variants, start=1))
+    return statements, uncovered
+
+
+def collect():
+    statements, uncovered = [], []
+    for module in MODULES:
+        found, missing = collect_module(module)
+        statements.extend(found)
+        uncovered.extend(missing)
+    for name, (_, sql) in QUERIES.items():
+        if SQL_START.match(sql):
+            statements.append((f"repository.{name}", sql))
+    return statements, uncovered
+
+
+def all_statements():
+    return collect()[0]
+
+
+def explainable(sql):
+    # placeholders become literals; LIMIT needs a number, everything else a string
+    sql = re.sub(r"(LIMIT\s+)%s", r"\g<1>10", sql, flags=re.I)
+    return "EXPLAIN " + sql.replace("%s", "'1'")
+
+
+# ---------- synthetic database ----------
+def load_database(config, database, scale=1.0):
+    conn = mysql.connector.connect(**config)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+        cursor.execute(f"CREATE DATABASE `{database}`")
+        cursor.execute(f"USE `{database}`")
+        run_sql_file(cursor, DUMP_FILE)
+        conn.commit()
+        migrate.migrate_up(conn, log=lambda msg: None)
+
+        users = int(CARDINALITIES["users"] * scale)
+        bookings = int(CARDINALITIES["bookings"] * scale)
+
+        # 0..999_999 from a 1000-row seed table
+        cursor.execute("CREATE TABLE _seed (n INT PRIMARY KEY)")
+        cursor.executemany("INSERT INTO _seed VALUES (%s)", [(n,) for n in range(1000)])
+        cursor.execute("""
+            CREATE TABLE _seq (n INT PRIMARY KEY)
+            SELECT a.n * 1000 + b.n AS n FROM _seed a CROSS JOIN _seed b
+        """)
+
+        cursor.execute("""
+            INSERT INTO users (fullname, username, email, password_hash, role, status)
+            SELECT CONCAT('User ', n), CONCAT('syn', n), CONCAT('syn', n, '@example.com'), 'x',
+                   IF(n %% 50 = 0, 'employee', 'customer'), 'active'
+            FROM _seq WHERE n < %s
+        """, (users,))
+        cursor.execute("""
+            INSERT INTO customers (user_id, address, phone)
+            SELECT id, 'Synthetic address', '000' FROM users WHERE role='customer' AND username LIKE 'syn%'
+        """)
+        cursor.execute("""
+            INSERT INTO employees (user_id, employee_code, department)
+            SELECT id, CONCAT('SYN', id), 'logistics' FROM users WHERE role='employee' AND username LIKE 'syn%'
+        """)
+        cursor.execute("SELECT MIN(id), COUNT(*) FROM customers")
+        first_customer, customer_count = cursor.fetchone()
+        cursor.execute("SELECT MIN(employee_id), COUNT(*) FROM employees")
+        first_employee, employee_count = cursor.fetchone()
+
+        cursor.execute("""
+            INSERT INTO cargo_bookings
+                (tracking_id, customer_id, sender_name, sender_address, recipient_name, recipient_address,
+                 weight, total_amount, status, origin_city, destination_city, booking_date,
+                 expected_delivery_date, assigned_employee_id, created_at, updated_at, service_type)
+            SELECT CONCAT('S', LPAD(n, 9, '0')), %s + n %% %s, 'Sender', 'Sender address',
+                   'Recipient', 'Recipient address', 1 + n %% 40, 100 + n %% 900,
+                   ELT(1 + n %% 5, 'pending', 'confirmed', 'in_transit', 'delivered', 'cancelled'),
+                   ELT(1 + n %% 8, 'Kochi', 'Kollam', 'Chennai', 'Mumbai', 'Delhi', 'Pune', 'Goa', 'Surat'),
+                   ELT(1 + n %% 7, 'Kochi', 'Kollam', 'Chennai', 'Mumbai', 'Delhi', 'Pune', 'Goa'),
+                   NOW() - INTERVAL (n %% 1000) DAY, CURDATE() - INTERVAL (n %% 1000) DAY + INTERVAL 5 DAY,
+                   %s + n %% %s, NOW() - INTERVAL (n %% 1000) DAY, NOW() - INTERVAL (n %% 1000) DAY,
+                   ELT(1 + n %% 4, 'economy', 'standard', 'express', 'overnight')
+            FROM _seq WHERE n < %s
+        """, (first_customer, customer_count, first_employee, employee_count, bookings))
+        cursor.execute("""
+            INSERT INTO tracking_updates (booking_id, location, status, notes, updated_at)
+            SELECT b.id, 'Hub', ELT(1 + s.n, 'pending', 'confirmed', 'dispatched', 'in_transit'), '',
+                   b.booking_date + INTERVAL s.n HOUR
+            FROM cargo_bookings b CROSS JOIN _seed s WHERE s.n < 4
+        """)
+        cursor.execute("""
+            INSERT INTO invoices (booking_id, amount, status, issued_at)
+            SELECT id, total_amount, 'pending', booking_date FROM cargo_bookings WHERE status = 'delivered'
+        """)
+        cursor.execute("DROP TABLE _seq")
+        cursor.execute("DROP TABLE _seed")
+        conn.commit()
+
+        # monthly statements for the last two years, then everything older
+        # than a year into the archive tables, then the rollups
+        today = date.today()
+        for back in range(24):
+            year, month = divmod(today.year * 12 + today.month - 1 - back, 12)
+            billing.run_billing(conn, month=f"{year}-{month + 1:02d}", consolidate=True)
+        archive.archive_shipments(conn, 365, batch_size=5000)
+        rollups.backfill(conn)
+
+        for table in ("users", "customers", "employees", "cargo_bookings", "tracking_updates", "invoices",
+                      "cargo_bookings_archive", "tracking_updates_archive", "invoices_archive",
+                      "consolidated_invoices", "consolidated_invoice_items"):
+            cursor.execute(f"ANALYZE TABLE `{table}`")
+            cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# ---------- checking plans ----------
+def allowed_full_scan(name):
+    # "module.function#3.2" is allowed by its own name, "module.function#3" or "module.function"
+    statement = re.sub(r"(#\d+)\.\d+$", r"\1", name)
+    return any(key in ALLOWED_FULL_SCANS for key in (name, statement, name.split("#")[0]))
+
+
+def plan_problems(name, sql, plan, row_budget=ROW_BUDGET, sort_row_budget=SORT_ROW_BUDGET):
+    problems = []
+    if allowed_full_scan(name):
+        return problems
+    has_limit = re.search(r"\bLIMIT\b", sql, re.I) is not None
+    for row in plan:
+        table = row.get("table") or ""
+        access = (row.get("type") or "").upper()
+        rows = int(row.get("rows") or 0)
+        extra = row.get("Extra") or ""
+        large = table in LARGE_TABLES
+
+        if large and access == "ALL":
+            problems.append(f"full table scan of {table} ({rows} rows)")
+        elif large and "Using filesort" in extra and rows > sort_row_budget:
+            problems.append(f"filesort of {rows} rows on {table}")
+        elif rows > row_budget and not (has_limit and access == "INDEX" and "filesort" not in extra):
+            problems.append(f"examines {rows} rows of {table} (budget {row_budget})")
+    return problems
+
+
+def check_plans(config, database, row_budget=ROW_BUDGET, sort_row_budget=SORT_ROW_BUDGET):
+    # returns [(name, sql, [problem, ...])] for failing statements
+    conn = mysql.connector.connect(database=database, **config)
+    cursor = conn.cursor(dictionary=True)
+    failures = []
+    try:
+        for name, sql in all_statements():
+            try:
+                cursor.execute(explainable(sql))
+                plan = cursor.fetchall()
+            except mysql.connector.Error as e:
+                failures.append((name, sql, [f"EXPLAIN failed: {e.msg}"]))
+                continue
+            problems = plan_problems(name, sql, plan, row_budget, sort_row_budget)
+            if problems:
+                failures.append((name, sql, problems))
+    finally:
+        cursor.close()
+        conn.close()
+    return failures
@@ -0,0 +1,101 @@
+from archive import archive_shipments, find_booking_events, find_customer_invoice, find_customer_invoices
+
+
+class FakeCursor:
+    # answers each query from the first table name it mentions
+    def __init__(self, tables):
+        self.tables = tables
+        self.executed = []
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        self.executed.append((sql, params))
+        table = sql.split("FROM", 1)[1].split()[0]
+        self._rows = [dict(row) for row in self.tables.get(table, [])]
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+
+def test_invoice_lookup_falls_back_to_the_archive():
+    cursor = FakeCursor({"invoices_archive": [{"id": 7, "tracking_id": "C8FA6767"}]})
+    invoice = find_customer_invoice(cursor, 2, 7)
+    assert invoice["archived"] is True
+    assert [sql.split("FROM", 1)[1].split()[0] for sql, _ in cursor.executed] == ["invoices", "invoices_archive"]
+
+
+def test_live_invoice_is_not_looked_up_in_the_archive():
+    cursor = FakeCursor({"invoices": [{"id": 7}]})
+    assert find_customer_invoice(cursor, 2, 7)["archived"] is False
+    assert len(cursor.executed) == 1
+
+
+def test_invoice_list_reads_live_and_archive_in_one_query():
+    cursor = FakeCursor({})
+    find_customer_invoices(cursor, 2)
+    (sql, params), = cursor.executed
+    assert "UNION ALL" in sql and "invoices_archive" in sql
+    assert params == (2, 2)
+
+
+def test_feed_backlog_comes_from_the_archive_for_archived_shipments():
+    cursor = FakeCursor({
+        "cargo_bookings_archive": [{"id": 1, "customer_id": 2}],
+        "tracking_updates_archive": [{"id": 11, "status": "delivered"}],
+    })
+    booking_id, customer_id, archived, events = find_booking_events(cursor, "C8FA6767", 10)
+    assert (booking_id, customer_id, archived) == (1, 2, True)
+    assert events == [{"id": 11, "status": "delivered"}]
+
+
+def test_feed_lookup_of_unknown_tracking_id():
+    assert find_booking_events(FakeCursor({}), "NOPE", 0) == (None, None, False, [])
+
+
+class RecordingConnection:
+    def __init__(self, booking_ids):
+        self.booking_ids = booking_ids
+        self.statements = []
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class RecordingCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        self.conn.statements.append(sql)
+        self._rows = [(i,) for i in self.conn.booking_ids] if sql.startswith("SELECT id FROM cargo_bookings") else []
+        if self._rows:
+            self.conn.booking_ids = []
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+def test_consolidated_links_are_archived_before_their_invoices_are_deleted():
+    conn = RecordingConnection([1, 2])
+    assert archive_shipments(conn, 365) == 2
+    statements = conn.statements
+    links = next(i for i, sql in enumerate(statements)
+                 if sql.startswith("INSERT INTO consolidated_invoice_items_archive"))
+    delete_invoices = statements.index("DELETE FROM invoices WHERE booking_id IN (%s,%s)")
+    assert links < delete_invoices
+    assert any(sql.startswith("INSERT INTO consolidated_invoices_archive") and "c.status <> 'pending'" in sql
+               for sql in statements[delete_invoices:])
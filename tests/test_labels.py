@@ -0,0 +1,64 @@
+import pytest
+
+import labels
+from labels import build_labels_pdf, check_label_count, select_label_rows
+
+
+def label_row(n):
+    return (f"TRK{n:08d}", "Sender", "1 Sender Street\nSender City", "555-0100",
+            f"Recipient {n}", "2 Recipient Road\nRecipient City", "555-0199",
+            "express", 2.5, "Colombo", "Kandy")
+
+
+class LimitCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = None
+
+    def execute(self, sql, params=()):
+        self.params = params
+
+    def fetchall(self):
+        return self.rows[:self.params[-1]]
+
+    def close(self):
+        pass
+
+
+class LimitConn:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return LimitCursor(self.rows)
+
+
+def test_select_label_rows_under_limit():
+    rows = [label_row(n) for n in range(3)]
+    assert select_label_rows(LimitConn(rows), limit=3) == rows
+
+
+def test_select_label_rows_rejects_truncated_selection():
+    with pytest.raises(ValueError, match="More than 3 bookings"):
+        select_label_rows(LimitConn([label_row(n) for n in range(4)]), limit=3)
+
+
+def test_check_label_count():
+    check_label_count(labels.MAX_LABELS)
+    with pytest.raises(ValueError):
+        check_label_count(labels.MAX_LABELS + 1)
+
+
+def test_merged_chunks_parse_strictly():
+    pytest.importorskip("reportlab")
+    pypdf = pytest.importorskip("pypdf")
+
+    rows = [label_row(n) for n in range(7)]
+    path, workdir = build_labels_pdf(rows, workers=2, chunk_size=3)
+    try:
+        reader = pypdf.PdfReader(path, strict=True)
+        assert len(reader.pages) == len(rows)
+        for row, page in zip(rows, reader.pages):
+            assert row[0] in page.extract_text()
+    finally:
+        list(labels.stream_file(path, workdir))
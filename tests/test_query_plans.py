@@ -0,0 +1,69 @@
+import json
+import os
+
+import pytest
+
+import query_plans
+
+# The EXPLAIN checks need a MySQL/MariaDB server; the scratch database is
+# dropped and recreated (unless QUERY_PLAN_SKIP_LOAD=1). For example
+#   QUERY_PLAN_DATABASE='{"host": "127.0.0.1", "port": 3307, "user": "root",
+#                         "password": "cargo", "database": "cargo_plan_check"}' \
+#   python -m pytest tests/test_query_plans.py
+# QUERY_PLAN_SCALE multiplies the synthetic row counts.
+QUERY_PLAN_DATABASE = json.loads(os.environ.get("QUERY_PLAN_DATABASE") or "null")
+
+
+def _describe(failures):
+    return "\n".join(f"{name}: {'; '.join(problems)}\n    {' '.join(sql.split())}"
+                     for name, sql, problems in failures)
+
+
+# ---------- collection (no database needed) ----------
+def test_every_sql_statement_is_collected():
+    statements, uncovered = query_plans.collect()
+    assert not uncovered, "statements the plan check cannot render:\n" + "\n".join(
+        f"{name}: {reason}" for name, reason in uncovered)
+    names = {name for name, _ in statements}
+    assert len(names) == len(statements)
+    for module in query_plans.MODULES:
+        assert any(name.startswith(f"{module}.") for name in names), module
+
+
+def test_fstrings_are_rendered_for_live_and_archive_tables():
+    statements = dict(query_plans.all_statements())
+    assert "{placeholders}" not in statements["app.customer_accounts#1"]
+    lookups = [sql for name, sql in statements.items() if name.startswith("archive.find_shipment#1.")]
+    assert [" FROM cargo_bookings b" in sql for sql in lookups] == [True, False]
+    assert " FROM cargo_bookings_archive b" in lookups[1]
+
+
+def test_allowed_scans_name_real_statements():
+    names = [name for name, _ in query_plans.all_statements()]
+    for key in query_plans.ALLOWED_FULL_SCANS:
+        assert any(name == key or name.startswith(key + "#") or name.startswith(key + ".") for name in names), key
+
+
+def test_plan_problems():
+    scan = [{"table": "cargo_bookings", "type": "ALL", "rows": 100000, "Extra": ""}]
+    lookup = [{"table": "cargo_bookings", "type": "ref", "rows": 12, "Extra": ""}]
+    assert query_plans.plan_problems("app.x#1", "SELECT 1", scan) == ["full table scan of cargo_bookings (100000 rows)"]
+    assert query_plans.plan_problems("app.x#1", "SELECT 1", lookup) == []
+    assert query_plans.plan_problems("rollups.backfill#3", "SELECT 1", scan) == []
+
+
+# ---------- EXPLAIN against synthetic data ----------
+@pytest.fixture(scope="module")
+def plan_database():
+    if not QUERY_PLAN_DATABASE:
+        pytest.skip("set QUERY_PLAN_DATABASE to check query plans")
+    config = {k: v for k, v in QUERY_PLAN_DATABASE.items() if k != "database"}
+    database = QUERY_PLAN_DATABASE.get("database", "cargo_plan_check")
+    if os.environ.get("QUERY_PLAN_SKIP_LOAD") != "1":
+        query_plans.load_database(config, database, float(os.environ.get("QUERY_PLAN_SCALE", 1)))
+    return config, database
+
+
+def test_query_plans_within_budget(plan_database):
+    failures = query_plans.check_plans(*plan_database)
+    assert not failures, f"{len(failures)} statements over budget:\n" + _describe(failures)
@@ -0,0 +1,279 @@
+import json
+import os
+
+import pytest
+
+import sharding
+from sharding import SHARD_BITS, ShardRouter, place_customer, shard_statement, shard_table_ddl
+
+# The integration tests below need several MySQL/MariaDB databases, ideally
+# on different servers. docker-compose.shards.yml in this directory starts
+# three local instances; then
+#   SHARD_TEST_DATABASES='[
+#     {"host": "127.0.0.1", "port": 3307, "user": "root", "password": "cargo", "database": "cargo_t0"},
+#     {"host": "127.0.0.1", "port": 3308, "user": "root", "password": "cargo", "database": "cargo_t1"},
+#     {"host": "127.0.0.1", "port": 3308, "user": "root", "password": "cargo", "database": "cargo_t2"}
+#   ]' python -m pytest tests/test_sharding.py
+# The first database is the primary and also shard 0. Every listed database
+# is dropped and recreated.
+SHARD_TEST_DATABASES = json.loads(os.environ.get("SHARD_TEST_DATABASES") or "[]")
+DUMP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cargo_db (3).sql")
+
+ITEMS_DDL = """CREATE TABLE `consolidated_invoice_items` (
+  `invoice_id` int(11) NOT NULL,
+  `consolidated_invoice_id` int(11) NOT NULL,
+  PRIMARY KEY (`invoice_id`),
+  KEY `consolidated_invoice_id` (`consolidated_invoice_id`),
+  CONSTRAINT `consolidated_invoice_items_ibfk_1` FOREIGN KEY (`invoice_id`) REFERENCES `invoices` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `consolidated_invoice_items_ibfk_2` FOREIGN KEY (`consolidated_invoice_id`) REFERENCES `consolidated_invoices` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
+
+
+# ---------- DDL and routing (no database needed) ----------
+def test_shard_ddl_widens_every_shard_id_reference():
+    ddl = shard_table_ddl(ITEMS_DDL, 2)
+    assert "`invoice_id` bigint(20) NOT NULL" in ddl
+    assert "`consolidated_invoice_id` bigint(20) NOT NULL" in ddl
+    assert ddl.startswith("CREATE TABLE IF NOT EXISTS")
+    assert ddl.endswith(f"AUTO_INCREMENT={(2 << SHARD_BITS) + 1}")
+
+
+def test_shard_ddl_drops_foreign_keys_into_the_primary():
+    ddl = shard_table_ddl("""CREATE TABLE `consolidated_invoices` (
+  `id` int(11) NOT NULL AUTO_INCREMENT,
+  `customer_id` int(11) NOT NULL,
+  PRIMARY KEY (`id`),
+  CONSTRAINT `consolidated_invoices_ibfk_1` FOREIGN KEY (`customer_id`) REFERENCES `customers` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB AUTO_INCREMENT=17 DEFAULT CHARSET=utf8mb4""", 1)
+    assert "REFERENCES `customers`" not in ddl
+    assert "PRIMARY KEY (`id`)\n)" in ddl
+    assert "AUTO_INCREMENT=17" not in ddl
+
+
+def test_shard_statement_only_rewrites_table_definitions():
+    like = "CREATE TABLE IF NOT EXISTS `invoices_archive` LIKE `invoices`"
+    alter = "ALTER TABLE `cargo_bookings` ADD KEY `k` (`customer_id`)"
+    assert shard_statement(like, 1) == like
+    assert shard_statement(alter, 1) == alter
+    assert "bigint(20)" in shard_statement(ITEMS_DDL, 1)
+
+
+class FakeDirectory:
+    def __init__(self, customers=None, bookings=None, tracking_ids=None):
+        self.customers = customers or {}
+        self.bookings = bookings or {}
+        self.tracking_ids = tracking_ids or {}
+
+    def customer_shard(self, customer_id):
+        return self.customers.get(customer_id, 0)
+
+    def relocated_booking(self, booking_id):
+        return self.bookings.get(int(booking_id))
+
+    def relocated_tracking_id(self, tracking_id):
+        return self.tracking_ids.get(tracking_id)
+
+    def clear(self):
+        pass
+
+
+def make_router(count, directory):
+    router = ShardRouter([{"database": f"s{n}"} for n in range(count)])
+    router.directory = directory
+    return router
+
+
+def test_customers_without_a_placement_stay_on_shard_zero():
+    router = make_router(3, FakeDirectory({7: 2}))
+    assert router.for_customer(7) == 2
+    assert router.for_customer(8) == 0
+
+
+def test_ids_route_by_their_shard_unless_relocated():
+    router = make_router(3, FakeDirectory(bookings={(1 << SHARD_BITS) + 5: 2}, tracking_ids={"1ABCDEF12": 2}))
+    assert router.for_booking_id((1 << SHARD_BITS) + 4) == 1
+    assert router.for_booking_id((1 << SHARD_BITS) + 5) == 2
+    assert router.for_tracking_id("1ABCDEF99") == 1
+    assert router.for_tracking_id("1ABCDEF12") == 2
+    assert router.for_tracking_id("C8FA6767") == 0  # issued before sharding
+
+
+class PlacementCursor:
+    def __init__(self, placed, customers):
+        self.placed = placed
+        self.customers = customers
+        self.inserted = None
+        self._result = None
+
+    def execute(self, sql, params=()):
+        if sql.startswith("SELECT shard, COUNT(*)"):
+            self._result = list(self.placed.items())
+        elif sql.startswith("SELECT COUNT(*) FROM customers"):
+            self._result = [(self.customers,)]
+        elif sql.startswith("INSERT INTO customer_shards"):
+            self.inserted = params
+
+    def fetchall(self):
+        return self._result
+
+    def fetchone(self):
+        return self._result[0]
+
+
+def test_placement_counts_unplaced_customers_on_shard_zero():
+    # 10 customers before sharding + 3 placed on shard 1, the new one is #14
+    cursor = PlacementCursor({1: 3}, customers=13)
+    assert place_customer(cursor, 14, 3) == 2
+    assert cursor.inserted == (14, 2)
+
+
+def test_placement_does_not_move_existing_customers_when_a_shard_is_added():
+    cursor = PlacementCursor({0: 5, 1: 5}, customers=10)
+    assert place_customer(cursor, 11, 3) == 2
+
+
+# ---------- several databases ----------
+needs_databases = pytest.mark.skipif(
+    len(SHARD_TEST_DATABASES) < 2, reason="set SHARD_TEST_DATABASES to at least two databases"
+)
+
+
+@pytest.fixture(scope="module")
+def cluster():
+    mysql_connector = pytest.importorskip("mysql.connector")
+    import migrate
+    from sqlscript import run_sql_file
+
+    for config in SHARD_TEST_DATABASES:
+        server = {k: v for k, v in config.items() if k != "database"}
+        conn = mysql_connector.connect(**server)
+        cursor = conn.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{config['database']}`")
+        cursor.execute(f"CREATE DATABASE `{config['database']}`")
+        cursor.close()
+        conn.close()
+
+    primary = mysql_connector.connect(**SHARD_TEST_DATABASES[0])
+    cursor = primary.cursor()
+    run_sql_file(cursor, DUMP_FILE)
+    primary.commit()
+    cursor.close()
+    migrate.migrate_up(primary, log=lambda msg: None)
+
+    router = ShardRouter(SHARD_TEST_DATABASES, primary_config=SHARD_TEST_DATABASES[0], directory_ttl=0)
+    sharding.init_shards(primary, router)
+    versions = [v for v, entry in migrate.available_migrations().items() if entry["scope"] == "shard"]
+    router.scatter(lambda conn: migrate.mark_applied(conn, versions))
+    yield primary, router
+    primary.close()
+
+
+def _fetch(router, shard, sql, params=()):
+    conn = router.connect(shard)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _add_customer(primary, name):
+    cursor = primary.cursor()
+    cursor.execute(
+        "INSERT INTO users (fullname, username, email, password_hash, role, status) VALUES (%s,%s,%s,'x','customer','active')",
+        (name, name, f"{name}@example.com")
+    )
+    cursor.execute("INSERT INTO customers (user_id) VALUES (%s)", (cursor.lastrowid,))
+    return cursor
+
+
+@needs_databases
+def test_shards_accept_billing_rows_for_shard_ids(cluster):
+    primary, router = cluster
+    last = router.count - 1
+    conn = router.connect(last)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO cargo_bookings (tracking_id, customer_id, sender_name, sender_address,
+                                        recipient_name, recipient_address, status)
+            VALUES ('ZTEST0001', 1, 's', 'a', 'r', 'a', 'delivered')
+        """)
+        booking_id = cursor.lastrowid
+        cursor.execute("INSERT INTO invoices (booking_id, amount, status) VALUES (%s, 10, 'pending')", (booking_id,))
+        invoice_id = cursor.lastrowid
+        cursor.execute("INSERT INTO consolidated_invoices (customer_id, period_start) VALUES (1, '2026-01-01')")
+        cursor.execute("INSERT INTO consolidated_invoice_items VALUES (%s, %s)", (invoice_id, cursor.lastrowid))
+        conn.rollback()
+    finally:
+        cursor.close()
+        conn.close()
+    assert booking_id >> SHARD_BITS == last
+    assert invoice_id >> SHARD_BITS == last
+
+
+@needs_databases
+def test_new_customers_are_placed_on_the_emptiest_shard(cluster):
+    primary, router = cluster
+    cursor = _add_customer(primary, "shardtest_new")
+    customer_id = cursor.lastrowid
+    shard = place_customer(cursor, customer_id, router.count)
+    primary.commit()
+    cursor.close()
+    assert shard != 0  # shard 0 holds every customer from before sharding
+    assert router.for_customer(customer_id) == shard
+
+
+@needs_databases
+def test_billing_lock_is_per_database(cluster):
+    from billing import BILLING_LOCK, run_billing
+
+    primary, router = cluster
+    holder = router.connect(1)
+    cursor = holder.cursor()
+    cursor.execute("SELECT GET_LOCK(CONCAT(%s, ':', DATABASE()), 0)", (BILLING_LOCK,))
+    assert cursor.fetchone()[0] == 1
+    try:
+        with pytest.raises(RuntimeError):
+            run_billing(router.connect(1))
+        run_billing(router.connect(0))  # another database, not blocked
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(CONCAT(%s, ':', DATABASE()))", (BILLING_LOCK,))
+        cursor.fetchone()
+        cursor.close()
+        holder.close()
+    router.scatter(run_billing)  # all shards at once
+
+
+@needs_databases
+def test_move_customer_copies_relocates_and_deletes(cluster):
+    primary, router = cluster
+    booking_id, tracking_id, customer_id = _fetch(
+        router, 0, "SELECT id, tracking_id, customer_id FROM cargo_bookings ORDER BY id LIMIT 1"
+    )[0]
+    target = router.count - 1
+    sharding.move_customer(primary, router, customer_id, target, settle_seconds=0, log=lambda msg: None)
+
+    assert _fetch(router, 0, "SELECT COUNT(*) FROM cargo_bookings WHERE customer_id=%s", (customer_id,))[0][0] == 0
+    assert _fetch(router, target, "SELECT tracking_id FROM cargo_bookings WHERE id=%s", (booking_id,)) == [(tracking_id,)]
+    assert router.for_customer(customer_id) == target
+    assert router.for_booking_id(booking_id) == target
+    assert router.for_tracking_id(tracking_id) == target
+    with pytest.raises(ValueError):
+        sharding.move_customer(primary, router, customer_id, 0, settle_seconds=0, log=lambda msg: None)
+
+
+@needs_databases
+def test_shards_have_no_pending_migrations(cluster):
+    import migrate
+
+    primary, router = cluster
+    for shard in range(router.count):
+        conn = router.connect(shard)
+        try:
+            assert migrate.migrate_up(conn, log=lambda msg: None, scope="shard",
+                                      transform=lambda sql, shard=shard: shard_statement(sql, shard)) == []
+        finally:
+            conn.close()
@@ -0,0 +1,196 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import tracking_filter
+from tracking_filter import BloomFilter, TrackingIdFilter
+
+
+class FakeShard:
+    # committed cargo_bookings rows: (id, tracking_id, created_at)
+    def __init__(self, now):
+        self.now = now
+        self.rows = []
+        self.archive = None
+
+    def book(self, row_id, tracking_id, created_at=None):
+        self.rows.append((row_id, tracking_id, created_at or self.now))
+
+
+class FakeCursor:
+    def __init__(self, shard):
+        self.shard = shard
+        self._result = []
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        if sql == "SELECT NOW()":
+            self._result = [(self.shard.now,)]
+        elif "information_schema.tables" in sql:
+            self._result = [(int(params[0] == "cargo_bookings_archive" and self.shard.archive is not None),)]
+        elif sql.startswith("SELECT COUNT(*) FROM "):
+            table = sql.rsplit(" ", 1)[1]
+            self._result = [(len(self._table(table)),)]
+        elif sql.startswith("SELECT id, tracking_id FROM "):
+            table = sql.split()[4]
+            after_id = params[0]
+            since = params[1] - timedelta(seconds=params[2]) if len(params) > 1 else None
+            self._result = [(row_id, tid) for row_id, tid, created_at in self._table(table)
+                            if row_id > after_id or (since is not None and created_at >= since)]
+        else:
+            raise AssertionError(f"unexpected SQL: {sql}")
+
+    def _table(self, table):
+        return self.shard.archive if table == "cargo_bookings_archive" else self.shard.rows
+
+    def fetchone(self):
+        return self._result.pop(0)
+
+    def fetchmany(self, size):
+        rows, self._result = self._result[:size], self._result[size:]
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, shard):
+        self.shard = shard
+
+    def cursor(self):
+        return FakeCursor(self.shard)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeRouter:
+    def __init__(self, *shards):
+        self.shards = shards
+        self.count = len(shards)
+
+    def connect(self, shard):
+        return FakeConnection(self.shards[shard])
+
+    def scatter(self, fn):
+        return [fn(FakeConnection(shard)) for shard in self.shards]
+
+
+@pytest.fixture
+def now():
+    return datetime(2026, 10, 1, 12, 0, 0)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    keys = [f"TRK{n:06d}" for n in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+
+
+def test_bloom_filter_false_positive_rate_is_near_target():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    for n in range(1000):
+        bloom.add(f"TRK{n:06d}")
+    false_positives = sum(f"MISS{n:06d}" in bloom for n in range(10000))
+    assert false_positives < 300
+
+
+def test_lookup_is_case_and_whitespace_insensitive(now):
+    shard = FakeShard(now)
+    shard.book(1, "TRK000001")
+    filter_ = TrackingIdFilter()
+    filter_.load(FakeRouter(shard))
+    assert filter_.might_exist(" trk000001 ", FakeRouter(shard))
+    assert not filter_.might_exist("", FakeRouter(shard))
+
+
+def test_build_reads_archive_and_every_shard(now):
+    first, second = FakeShard(now), FakeShard(now)
+    first.book(1, "LIVE1")
+    first.archive = [(7, "ARCHIVED1", now)]
+    second.book(1 << 40, "LIVE2")
+    router = FakeRouter(first, second)
+    filter_ = TrackingIdFilter(refresh_interval=3600)
+    filter_.load(router)
+    assert all(filter_.might_exist(tid, router) for tid in ("LIVE1", "ARCHIVED1", "LIVE2"))
+
+
+def test_miss_catches_up_with_new_bookings(now):
+    shard = FakeShard(now)
+    shard.book(1, "OLD")
+    router = FakeRouter(shard)
+    filter_ = TrackingIdFilter(refresh_interval=0)
+    filter_.load(router)
+
+    shard.book(2, "NEW")
+    assert filter_.might_exist("NEW", router)
+    assert not filter_.might_exist("NEVER", router)
+
+
+def test_catch_up_sees_booking_committed_below_high_water(now):
+    # id 2 is inserted first but commits after id 3 was already scanned
+    shard = FakeShard(now)
+    shard.book(1, "FIRST")
+    shard.book(3, "FAST")
+    router = FakeRouter(shard)
+    filter_ = TrackingIdFilter(refresh_interval=0)
+    filter_.load(router)
+
+    shard.book(2, "SLOW", created_at=now - timedelta(seconds=5))
+    shard.now = now + timedelta(seconds=30)
+    assert filter_.might_exist("SLOW", router)
+
+
+def test_late_commit_window_bounds_the_guarantee(now):
+    shard = FakeShard(now)
+    shard.book(3, "FAST")
+    router = FakeRouter(shard)
+    filter_ = TrackingIdFilter(refresh_interval=0)
+    filter_.load(router)
+
+    late = now - timedelta(seconds=tracking_filter.LATE_COMMIT_WINDOW + 1)
+    shard.book(2, "STUCK", created_at=late)
+    assert not filter_.might_exist("STUCK", router)
+    filter_.rebuild(router)
+    assert filter_.might_exist("STUCK", router)
+
+
+def test_snapshot_round_trip_resumes_from_marks(tmp_path, now):
+    path = tmp_path / "tracking_filter.bin"
+    shard = FakeShard(now)
+    shard.book(1, "BEFORE")
+    router = FakeRouter(shard)
+    TrackingIdFilter(snapshot_path=str(path), refresh_interval=3600).load(router)
+
+    shard.rows = []  # a restart must not re-read what the snapshot already holds
+    shard.book(2, "AFTER")
+    shard.now = now + timedelta(minutes=1)
+    restarted = TrackingIdFilter(snapshot_path=str(path), refresh_interval=3600)
+    restarted.load(router)
+    assert restarted.might_exist("BEFORE", router)
+    assert restarted.might_exist("AFTER", router)
+    assert restarted._marks == {0: (2, now + timedelta(minutes=1))}
+
+
+def test_snapshot_is_ignored_when_shard_count_changes(tmp_path, now):
+    path = tmp_path / "tracking_filter.bin"
+    TrackingIdFilter(snapshot_path=str(path)).load(FakeRouter(FakeShard(now)))
+    filter_ = TrackingIdFilter(snapshot_path=str(path))
+    assert not filter_._load_snapshot(2)
+    assert filter_._load_snapshot(1)
+
+
+def test_corrupt_snapshot_falls_back_to_full_build(tmp_path, now):
+    path = tmp_path / "tracking_filter.bin"
+    path.write_bytes(b"\x05\x00\x00\x00{not json")
+    shard = FakeShard(now)
+    shard.book(1, "TRK1")
+    filter_ = TrackingIdFilter(snapshot_path=str(path))
+    filter_.load(FakeRouter(shard))
+    assert filter_.might_exist("TRK1", FakeRouter(shard))
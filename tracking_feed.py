@@ -0,0 +1,122 @@
+import json
+import queue
+import threading
+
+# ---------- LIVE TRACKING FEED ----------
+# Status updates are published per tracking_id and pushed to browsers over
+# Server-Sent Events. Subscribers are plain queues, so an idle connection
+# costs one queue and one blocked greenlet on the gevent SSE server
+# (gunicorn.sse.conf.py), or a whole thread on the gthread server. Event
+# ids are tracking_updates.id, which lets reconnecting clients resume from
+# the database using Last-Event-ID.
+
+
+class LocalBroker:
+    # fan-out inside one process
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._topics = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic):
+        q = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            self._topics.setdefault(topic, set()).add(q)
+        return q
+
+    def unsubscribe(self, topic, q):
+        with self._lock:
+            subscribers = self._topics.get(topic)
+            if subscribers:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def publish(self, topic, event):
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                pass  # slow client; it will catch up from the DB on reconnect
+
+
+class RedisBroker(LocalBroker):
+    # cross-process: publish through Redis, each process fans out locally.
+    # The pub/sub connection and listener thread are only started by the
+    # first subscribe, so a broker created before fork() (preload_app) has
+    # no thread or socket to lose; workers still recreate it after fork.
+
+    CHANNEL_PREFIX = "tracking:"
+
+    def __init__(self, url, max_pending=100):
+        super().__init__(max_pending)
+        import redis  # optional dependency, only needed for this backend
+
+        self._redis = redis.Redis.from_url(url)
+        self._pubsub = None
+        self._listener = None
+        self._start_lock = threading.Lock()
+
+    def subscribe(self, topic):
+        if self._listener is None:
+            self._start_listener()
+        return super().subscribe(topic)
+
+    def publish(self, topic, event):
+        self._redis.publish(self.CHANNEL_PREFIX + topic, json.dumps(event, default=str))
+
+    def _start_listener(self):
+        with self._start_lock:
+            if self._listener is not None:
+                return
+            self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.psubscribe(self.CHANNEL_PREFIX + "*")
+            self._listener = threading.Thread(target=self._listen, daemon=True, name="tracking-broker")
+            self._listener.start()
+
+    def _listen(self):
+        for message in self._pubsub.listen():
+            topic = message["channel"].decode()[len(self.CHANNEL_PREFIX):]
+            super().publish(topic, json.loads(message["data"]))
+
+
+def create_broker(url=None):
+    if url and url.startswith("redis"):
+        return RedisBroker(url)
+    return LocalBroker()
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: tracking\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+def backlog_stream(backlog):
+    # finished stream for a shipment that no longer changes (archived)
+    yield "retry: 5000\n\n"
+    for event in backlog:
+        yield format_event(event)
+
+
+def event_stream(broker, topic, subscription, backlog, heartbeat=15):
+    # backlog: events already missed (read from the DB after subscribing)
+    last_id = 0
+    try:
+        yield "retry: 5000\n\n"
+        for event in backlog:
+            last_id = event["id"]
+            yield format_event(event)
+        while True:
+            try:
+                event = subscription.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            if event["id"] <= last_id:
+                continue  # already sent from the backlog
+            last_id = event["id"]
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(topic, subscription)
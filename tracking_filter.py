@@ -0,0 +1,241 @@
+import hashlib
+import json
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# ---------- TRACKING-ID FILTER ----------
+# Bloom filter of every tracking id ever issued, so lookups for ids that
+# cannot exist (typos, bots enumerating random ids) are answered without a
+# query. A "maybe" still goes to MySQL as before.
+#
+# Other worker processes issue ids too. On a miss the filter pulls any
+# bookings added since its last scan of each shard (at most once per
+# refresh_interval) before answering "no".
+#
+# A scan reads ids above the shard's high-water mark plus every booking
+# created within LATE_COMMIT_WINDOW seconds before the previous scan (by the
+# database clock; both columns are indexed). Auto-increment ids are handed
+# out at INSERT but become visible at COMMIT, so a booking can appear below
+# the mark after a scan has passed it; the window picks it up as long as its
+# transaction commits within LATE_COMMIT_WINDOW of the INSERT. A booking
+# committed later than that is answered "no" until the next
+# 'flask rebuild-tracking-filter'.
+#
+# The bit array and the per-shard marks are saved as a snapshot file; on
+# restart only the bookings made since the snapshot are read.
+
+SNAPSHOT_VERSION = 2
+FETCH_SIZE = 10000
+LATE_COMMIT_WINDOW = 300
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(int(capacity), 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+def normalize(tracking_id):
+    # tracking ids are issued upper-case; MySQL matches them case-insensitively
+    return (tracking_id or "").strip().upper()
+
+
+class TrackingIdFilter:
+    def __init__(self, snapshot_path=None, capacity=1000000, error_rate=0.001, refresh_interval=1.0):
+        self.snapshot_path = snapshot_path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self._bloom = None
+        self._marks = {}  # shard -> (high-water id, database time of the scan)
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._bloom is not None
+
+    def add(self, tracking_id):
+        if self._bloom is not None:
+            self._bloom.add(normalize(tracking_id))
+
+    def might_exist(self, tracking_id, router):
+        # False only when the id was certainly never issued
+        key = normalize(tracking_id)
+        if not key:
+            return False
+        if self._bloom is None or key in self._bloom:
+            return True
+        if time.monotonic() - self._last_refresh < self.refresh_interval:
+            return False
+        with self._lock:
+            if time.monotonic() - self._last_refresh >= self.refresh_interval:
+                self.catch_up(router)
+        return key in self._bloom
+
+    # --- building ---
+    def load(self, router):
+        # snapshot + catch-up when there is a usable snapshot, full build otherwise
+        with self._lock:
+            if not self._load_snapshot(router.count):
+                self._build(router)
+            else:
+                self.catch_up(router)
+            if self.snapshot_path:
+                self.save_snapshot()
+
+    def rebuild(self, router):
+        # full rebuild, e.g. once far more bookings exist than the filter was sized for
+        with self._lock:
+            self._build(router)
+            if self.snapshot_path:
+                self.save_snapshot()
+
+    def _build(self, router):
+        counts = router.scatter(_count_bookings)
+        bloom = BloomFilter(max(self.capacity, 2 * sum(counts)), self.error_rate)
+        marks = {}
+        for shard in range(router.count):
+            conn = router.connect(shard)
+            try:
+                marks[shard] = _add_rows(conn, bloom, "cargo_bookings", 0)
+                if _table_exists(conn, "cargo_bookings_archive"):
+                    _add_rows(conn, bloom, "cargo_bookings_archive", 0)
+            finally:
+                conn.close()
+        self._bloom = bloom
+        self._marks = marks
+        self._last_refresh = time.monotonic()
+
+    def catch_up(self, router):
+        for shard in range(router.count):
+            conn = router.connect(shard)
+            try:
+                last_id, scanned_at = self._marks.get(shard, (0, None))
+                self._marks[shard] = _add_rows(conn, self._bloom, "cargo_bookings", last_id, scanned_at)
+            finally:
+                conn.close()
+        self._last_refresh = time.monotonic()
+
+    # --- snapshot ---
+    def save_snapshot(self):
+        header = json.dumps({
+            "version": SNAPSHOT_VERSION,
+            "size": self._bloom.size,
+            "hashes": self._bloom.hashes,
+            "shards": len(self._marks),
+            "marks": {str(shard): [last_id, scanned_at.isoformat() if scanned_at else None]
+                      for shard, (last_id, scanned_at) in self._marks.items()},
+        }).encode("utf-8")
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tracking_filter.")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(struct.pack("<I", len(header)))
+                fh.write(header)
+                fh.write(self._bloom.bits)
+            os.replace(tmp_path, self.snapshot_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _load_snapshot(self, shard_count):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, "rb") as fh:
+                (header_len,) = struct.unpack("<I", fh.read(4))
+                header = json.loads(fh.read(header_len).decode("utf-8"))
+                bits = fh.read()
+        except (OSError, ValueError, struct.error):
+            return False
+        if header.get("version") != SNAPSHOT_VERSION or header.get("shards") != shard_count:
+            return False
+        bloom = BloomFilter.__new__(BloomFilter)
+        bloom.size = header["size"]
+        bloom.hashes = header["hashes"]
+        bloom.bits = bytearray(bits)
+        if len(bloom.bits) != (bloom.size + 7) // 8:
+            return False
+        self._bloom = bloom
+        self._marks = {int(shard): (last_id, datetime.fromisoformat(scanned_at) if scanned_at else None)
+                       for shard, (last_id, scanned_at) in header["marks"].items()}
+        return True
+
+
+def _table_exists(conn, table):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = %s
+        """, (table,))
+        return cursor.fetchone()[0] > 0
+    finally:
+        cursor.close()
+
+
+def _count_bookings(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*) FROM cargo_bookings")
+        count = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    if _table_exists(conn, "cargo_bookings_archive"):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT COUNT(*) FROM cargo_bookings_archive")
+            count += cursor.fetchone()[0]
+        finally:
+            cursor.close()
+    return count
+
+
+def _add_rows(conn, bloom, table, after_id, since=None):
+    # adds tracking ids with id > after_id, plus those created within
+    # LATE_COMMIT_WINDOW before `since`; returns (high-water id, scan time)
+    cursor = conn.cursor()
+    last_id = after_id
+    try:
+        cursor.execute("SELECT NOW()")
+        scanned_at = cursor.fetchone()[0]
+        if since is None:
+            cursor.execute(f"SELECT id, tracking_id FROM {table} WHERE id > %s", (after_id,))
+        else:
+            cursor.execute(
+                f"SELECT id, tracking_id FROM {table} "
+                "WHERE id > %s OR created_at >= %s - INTERVAL %s SECOND",
+                (after_id, since, LATE_COMMIT_WINDOW)
+            )
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            for row_id, tracking_id in rows:
+                bloom.add(normalize(tracking_id))
+                last_id = max(last_id, row_id)
+    finally:
+        cursor.close()
+    conn.commit()  # end the read snapshot so the next catch-up sees new rows
+    return last_id, scanned_at
@@ -0,0 +1,12 @@
+import time
+
+_started = time.perf_counter()
+
+from app import app, warm_up, load_tracking_filter  # noqa: E402
+
+# Templates, reportlab and the tracking-id filter are loaded once here; with
+# gunicorn's preload_app that happens in the master and is shared with the
+# workers. The DB pool is filled per worker in gunicorn.conf.py (post_fork).
+warm_up(db=False)
+load_tracking_filter()
+app.logger.info("App imported and warmed in %.0f ms", (time.perf_counter() - _started) * 1000)